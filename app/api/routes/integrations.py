@@ -1,8 +1,8 @@
 """Health check and integration endpoints"""
-from fastapi import APIRouter, Depends, HTTPException, Body
+from fastapi import APIRouter, Depends, Body
 from sqlalchemy.orm import Session
 from app.database import get_db
-from app.services.ozon_service import OzonService
+from app.services.ozon_service import OzonService, get_ozon_service
 from app.services.ai_service import AIService
 from app.config import settings
 import logging
@@ -26,7 +26,7 @@ def health_status(db: Session = Depends(get_db)):
 @router.get("/integrations")
 def check_integrations():
     # Смотрим какие интеграции настроены и работают
-    ozon_service = OzonService()
+    ozon_service = get_ozon_service()
     ai_service = AIService()
     
     return {
@@ -67,7 +67,10 @@ async def test_ozon_connection(credentials: dict = Body(...)):
         service = OzonService(client_id=client_id, api_key=api_key)
         
         # Try to fetch reviews (this will test the connection)
-        result = await service.get_reviews(limit=1)
+        try:
+            result = await service.get_reviews(limit=1)
+        finally:
+            await service.aclose()
         
         if result:
             return {
@@ -108,7 +111,10 @@ async def test_openai_connection(credentials: dict = Body(...)):
         service = AIService(api_key=api_key)
         
         # Try to analyze sentiment
-        result = await service.analyze_sentiment("Test review")
+        try:
+            result = await service.analyze_sentiment("Test review")
+        finally:
+            await service.close()
         
         if result:
             return {
@@ -162,7 +168,8 @@ async def test_yandex_connection(credentials: dict = Body(...)):
                 "configured": True,
                 "data": {
                     "model": result.get("model"),
-                    "available": result.get("available")
+                    "available": result.get("available"),
+                    "warning": result.get("warning")
                 }
             }
         else:
@@ -1,12 +1,15 @@
 """Response/Answer endpoints"""
+import orjson
 from fastapi import APIRouter, Depends, HTTPException
+from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
-from typing import List
+from typing import List, Optional
 from app.database import get_db
 from app.schemas.response import ResponseSchema, ResponseDraftSchema, ResponseCreateSchema
 from app.models.response import Response, ResponseDraft
 from app.models.review import Review
 from app.services.review_service import ReviewService
+from app.services.yandex_service import YandexGPTService
 
 router = APIRouter(prefix="/api/responses", tags=["responses"])
 
@@ -22,6 +25,39 @@ def get_response_drafts(review_id: int, db: Session = Depends(get_db)):
     return drafts
 
 
+@router.get("/drafts/{review_id}/stream")
+async def stream_response_drafts(
+    review_id: int,
+    num_variants: int = 3,
+    tone: Optional[str] = None,
+    db: Session = Depends(get_db)
+):
+    """
+    Stream fresh YandexGPT draft variants as Server-Sent Events (not saved)
+    
+    Events: `data: {"variant": n, "delta": "..."}` per chunk, then `event: done`.
+    """
+    review = db.query(Review).filter(Review.id == review_id).first()
+    if not review:
+        raise HTTPException(status_code=404, detail="Review not found")
+    
+    service = YandexGPTService()
+    review_text = review.text or ""
+    
+    async def events():
+        async for variant, delta in service.generate_response_drafts_stream(
+            review_text, num_variants=min(max(num_variants, 1), 5), tone=tone
+        ):
+            yield b"data: " + orjson.dumps({"variant": variant, "delta": delta}) + b"\n\n"
+        yield b"event: done\ndata: {}\n\n"
+    
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
 @router.get("/{response_id}", response_model=ResponseSchema)
 def get_response(response_id: int, db: Session = Depends(get_db)):
     """Get response details"""
@@ -55,13 +91,13 @@ async def create_response(
     return response
 
 
-@router.get("/history/recent")
+@router.get("/history/recent", response_model=List[ResponseSchema])
 def get_recent_responses(limit: int = 100, db: Session = Depends(get_db)):
     """Get recent responses"""
     responses = db.query(Response).order_by(
         Response.created_at.desc()
     ).limit(limit).all()
-    return [ResponseSchema.from_orm(r) for r in responses]
+    return responses
 
 
 @router.get("/status/{status}", response_model=List[ResponseSchema])
@@ -1,19 +1,24 @@
 """Review endpoints"""
 from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
+from fastapi.responses import ORJSONResponse, Response
+from pydantic import TypeAdapter
+from sqlalchemy.orm import Session, load_only
 from sqlalchemy import func, case
 from typing import List, Optional
 from app.database import get_db
 from app.schemas.review import ReviewSchema, ReviewDetail
 from app.models.review import Review
-from app.services.ozon_service import OzonService
-from app.services.review_service import ReviewService
+from app.services.ozon_service import OzonService, get_ozon_service
+from app.services.review_service import ReviewService, stats_cache, stats_cache_lock
 import logging
 
 logger = logging.getLogger(__name__)
 
 router = APIRouter(prefix="/api/reviews", tags=["reviews"])
 
+# Validates and serializes a whole review list in one pass
+REVIEW_LIST_ADAPTER = TypeAdapter(List[ReviewSchema])
+
 
 @router.get("", response_model=List[ReviewSchema])
 def get_reviews(
@@ -24,7 +29,11 @@ def get_reviews(
     db: Session = Depends(get_db)
 ):
     """Get list of reviews with answered filter and sorting."""
-    query = db.query(Review)
+    # Load only the columns ReviewSchema needs
+    query = db.query(Review).options(load_only(
+        Review.id, Review.ozon_review_id, Review.product_name, Review.customer_name, Review.rating,
+        Review.text, Review.sentiment, Review.category, Review.answered, Review.created_at
+    ))
 
     if answered is not None:
         query = query.filter(Review.answered == answered)
@@ -39,41 +48,52 @@ def get_reviews(
     return reviews
 
 
-@router.get("/unanswered/list")
+@router.get("/unanswered/list", response_model=List[ReviewSchema])
 def get_unanswered_reviews(limit: int = 50, db: Session = Depends(get_db)):
     """Get list of unanswered reviews"""
     reviews = db.query(Review).filter(
         Review.answered == False
     ).order_by(Review.created_at.desc()).limit(limit).all()
-    return [ReviewSchema.from_orm(r) for r in reviews]
+    data = REVIEW_LIST_ADAPTER.dump_json(REVIEW_LIST_ADAPTER.validate_python(reviews, from_attributes=True))
+    return Response(content=data, media_type="application/json")
 
 
 @router.get("/stats")
 def get_review_stats(db: Session = Depends(get_db)):
     """Return aggregated review statistics from DB."""
-    total_reviews = db.query(func.count(Review.id)).scalar() or 0
-    unanswered = db.query(func.count(Review.id)).filter(Review.answered == False).scalar() or 0
-    avg_rating = db.query(func.avg(Review.rating)).scalar()
-
-    products_count = db.query(func.count(func.distinct(Review.product_id))).scalar() or 0
-    # If product_id is missing, fall back to product_name
-    if products_count == 0:
-        products_count = db.query(func.count(func.distinct(Review.product_name))).scalar() or 0
-    # As a last resort, count distinct review IDs
-    if products_count == 0:
-        products_count = db.query(func.count(func.distinct(Review.ozon_review_id))).scalar() or 0
-
-    return {
-        "total_reviews": total_reviews,
-        "unanswered": unanswered,
+    with stats_cache_lock:
+        cached = stats_cache.get(("stats",))
+    if cached is not None:
+        return cached
+
+    # Single pass over the table; if product_id is missing, fall back to
+    # product_name and, as a last resort, to the review ID
+    total_reviews, unanswered, avg_rating, products_count = db.query(
+        func.count(Review.id),
+        func.sum(case((Review.answered == False, 1), else_=0)),
+        func.avg(Review.rating),
+        func.count(func.distinct(func.coalesce(Review.product_id, Review.product_name, Review.ozon_review_id))),
+    ).one()
+
+    stats = {
+        "total_reviews": total_reviews or 0,
+        "unanswered": unanswered or 0,
         "avg_rating": round(avg_rating, 1) if avg_rating is not None else 0,
         "products": products_count or 0
     }
+    with stats_cache_lock:
+        stats_cache[("stats",)] = stats
+    return stats
 
 
-@router.get("/products")
+@router.get("/products", response_class=ORJSONResponse)
 def get_products_summary(limit: int = 50, db: Session = Depends(get_db)):
     """Return aggregated stats per product (top N by review count)."""
+    with stats_cache_lock:
+        cached = stats_cache.get(("products", limit))
+    if cached is not None:
+        return ORJSONResponse(cached)
+
     rows = (
         db.query(
             Review.product_id.label("product_id"),
@@ -97,68 +117,48 @@ def get_products_summary(limit: int = 50, db: Session = Depends(get_db)):
                 "sku": pid,
                 "name": name,
                 "reviews": row.reviews_count or 0,
-                "unanswered": row.unanswered_count or 0,
-                "avg_rating": round(row.avg_rating, 1) if row.avg_rating is not None else 0,
+                # PostgreSQL returns SUM/AVG as Decimal, which orjson can't encode
+                "unanswered": int(row.unanswered_count or 0),
+                "avg_rating": float(round(row.avg_rating, 1)) if row.avg_rating is not None else 0,
             }
         )
 
-    return products
+    with stats_cache_lock:
+        stats_cache[("products", limit)] = products
+    return ORJSONResponse(products)
 
 
 @router.post("/sync")
-async def sync_reviews(db: Session = Depends(get_db)):
+async def sync_reviews(
+    db: Session = Depends(get_db),
+    ozon_service: OzonService = Depends(get_ozon_service)
+):
     """Fetch fresh reviews from Ozon (last 30 days) and store them locally."""
-    ozon_service = OzonService()
     if not ozon_service.validate_credentials():
         raise HTTPException(status_code=400, detail="Ozon API credentials are not configured")
 
     service = ReviewService(db)
 
     try:
-        offset = 0
-        limit = 100
         total_fetched = 0
         total_saved = 0
-        max_iterations = 10  # Max 1000 reviews per sync call
+        total_available = None
         
-        for iteration in range(max_iterations):
-            logger.info(f"Sync batch {iteration + 1}/{max_iterations}, offset {offset}...")
-            result = await ozon_service.get_reviews(limit=limit, offset=offset, days_back=30)
-            
-            if not result:
-                logger.warning(f"Failed to fetch reviews at offset {offset}")
-                break
+        # Max 1000 reviews per sync call
+        async for offset, reviews, total in ozon_service.fetch_review_pages(max_pages=10, days_back=30):
+            total_available = total
+            logger.info(f"Processing {len(reviews)} reviews at offset {offset} (total: {total})")
             
-            # Extract reviews (handle both direct and nested structures)
-            reviews = result.get("reviews", [])
-            if not reviews and isinstance(result, dict):
-                nested = result.get("result")
-                if isinstance(nested, dict):
-                    reviews = nested.get("reviews", [])
-            
-            if not reviews:
-                logger.info(f"No more reviews at offset {offset}")
-                break
-            
-            logger.info(f"Processing {len(reviews)} reviews at offset {offset}")
-            
-            for review_data in reviews:
-                saved = await service.process_new_review(review_data)
-                if saved:
-                    total_saved += 1
+            saved = await service.process_new_reviews_batch(reviews)
+            total_saved += len(saved)
             
             total_fetched += len(reviews)
-            offset += limit
-            
-            # Stop if we got less than requested
-            if len(reviews) < limit:
-                logger.info(f"Reached end of reviews at offset {offset}")
-                break
         
         logger.info(f"Sync complete: fetched {total_fetched}, saved {total_saved}")
         return {
             "fetched": total_fetched,
             "saved": total_saved,
+            "total": total_available,
             "message": f"Successfully synced {total_saved} fresh reviews from last 30 days ({total_fetched} fetched)"
         }
     except Exception as exc:
@@ -1,4 +1,5 @@
 """Settings endpoints"""
+import asyncio
 import logging
 import os
 from fastapi import APIRouter, Depends, HTTPException
@@ -9,6 +10,7 @@ from app.schemas.settings import SettingsSchema
 from app.models.settings import Settings
 from app.services.ai_service import AIService
 from app.services.auto_response_service import AutoResponseService
+from app.services.ozon_service import get_ozon_service
 from app.config import settings
 from openai import OpenAI, AuthenticationError, RateLimitError, APIError
 
@@ -98,6 +100,7 @@ def set_ozon_credentials(payload: OzonCredentials):
     """Update Ozon credentials in runtime config and persist to .env."""
     settings.ozon_client_id = payload.client_id.strip()
     settings.ozon_api_key = payload.api_key.strip()
+    get_ozon_service().set_credentials(settings.ozon_client_id, settings.ozon_api_key)
 
     env_file = ".env"
     lines = []
@@ -540,8 +543,8 @@ async def check_yandex_key(payload: dict = None):
     import os
     from dotenv import load_dotenv
     
-    # Reload .env to pick up recent changes
-    load_dotenv(".env", override=True)
+    # Reload .env to pick up recent changes (file I/O off the event loop)
+    await asyncio.to_thread(load_dotenv, ".env", override=True)
     
     # Use provided credentials or fall back to config
     if payload is None:
@@ -587,6 +590,7 @@ async def check_yandex_key(payload: dict = None):
                 "is_valid": True,
                 "message": "✅ YandexGPT подключение работает!",
                 "model": model,
+                "warning": health.get("warning"),
                 "available_models": YandexGPTService.AVAILABLE_MODELS
             }
         else:
@@ -1,10 +1,8 @@
 """Background tasks for periodic review fetching"""
-import asyncio
 import logging
-from datetime import datetime
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
 from app.database import SessionLocal
-from app.services.ozon_service import OzonService
+from app.services.ozon_service import get_ozon_service
 from app.services.review_service import ReviewService
 from app.config import settings
 
@@ -15,7 +13,7 @@ class ReviewPoller:
     """Handles periodic fetching of reviews from Ozon"""
     
     def __init__(self):
-        self.ozon_service = OzonService()
+        self.ozon_service = get_ozon_service()
         self.scheduler = AsyncIOScheduler()
     
     async def poll_reviews(self):
@@ -32,42 +30,13 @@ class ReviewPoller:
             service = ReviewService(db)
             
             # Fetch reviews from last 30 days (Ozon API doesn't support large offsets well)
-            # We'll make multiple requests with the same 30-day window to get all available reviews
-            limit = 100
-            offset = 0
-            max_iterations = 5  # Limit to 500 reviews per polling cycle to avoid timeout
-            
-            for iteration in range(max_iterations):
-                logger.info(f"Fetching batch {iteration + 1}/{max_iterations}, offset {offset}...")
-                result = await self.ozon_service.get_reviews(limit=limit, offset=offset, days_back=30)
-                
-                if not result:
-                    logger.warning(f"Failed to fetch reviews at offset {offset}")
-                    break
-                
-                # Process each review (Ozon sometimes nests the list under result.reviews)
-                reviews = result.get("reviews", [])
-                if not reviews and isinstance(result, dict):
-                    nested = result.get("result")
-                    if isinstance(nested, dict):
-                        reviews = nested.get("reviews", [])
+            # Limit to 500 reviews per polling cycle to avoid timeout
+            async for offset, reviews, total in self.ozon_service.fetch_review_pages(max_pages=5, days_back=30):
+                logger.info(f"Processing {len(reviews)} reviews at offset {offset} (total: {total})")
                 
-                if not reviews:
-                    logger.info(f"No more reviews at offset {offset}. Total processed: {total_processed}")
-                    break
-                
-                logger.info(f"Processing {len(reviews)} reviews at offset {offset}")
-                
-                for review_data in reviews:
-                    await service.process_new_review(review_data)
+                await service.process_new_reviews_batch(reviews)
                 
                 total_processed += len(reviews)
-                offset += limit
-                
-                # Stop if we got less than requested
-                if len(reviews) < limit:
-                    logger.info(f"Reached end of reviews (got {len(reviews)} < {limit}). Total processed: {total_processed}")
-                    break
             
             logger.info(f"Successfully processed {total_processed} reviews")
             
@@ -133,3 +102,4 @@ async def start_background_tasks():
 async def shutdown_background_tasks():
     """Stop background tasks"""
     poller.stop()
+    await poller.ozon_service.aclose()
@@ -1,6 +1,15 @@
 """Application configuration"""
+from functools import lru_cache
 from pydantic_settings import BaseSettings
-import os
+
+
+@lru_cache(maxsize=8)
+def normalize_ozon_client_id(client_id_value) -> str:
+    """Ozon requires Client-Id to be a numeric string"""
+    try:
+        return str(int(str(client_id_value).strip()))
+    except (ValueError, TypeError):
+        return str(client_id_value).strip()
 
 
 class Settings(BaseSettings):
@@ -21,6 +30,12 @@ class Settings(BaseSettings):
     yandex_api_key: str = ""
     yandex_folder_id: str = ""
     yandex_model: str = "yandexgpt-3"  # yandexgpt-3, yandexgpt-3-pro
+    yandex_max_concurrency: int = 10  # Max simultaneous requests to YandexGPT
+    yandex_rps: float = 10.0  # Requests per second allowed by folder quota
+    
+    # Local classifier (optional: needs onnxruntime + tokenizers)
+    local_classifier_dir: str = ""  # Dir with sentiment.onnx, category.onnx, tokenizer.json
+    local_classifier_min_confidence: float = 0.6  # Below this the review goes to the API
     
     # AI Provider selection
     ai_provider: str = "openai"  # openai or yandex
@@ -37,10 +52,6 @@ class Settings(BaseSettings):
     # Auto-response settings
     auto_response_enabled: bool = False  # Auto-generate draft on new reviews
     
-    class Config:
-        env_file = ".env"
-        env_file_encoding = "utf-8"
-        case_sensitive = False
     # Server settings
     debug: bool = False
     host: str = "0.0.0.0"
@@ -49,9 +60,21 @@ class Settings(BaseSettings):
     # Polling settings
     polling_interval_minutes: int = 30  # How often to fetch new reviews
     
+    @property
+    def ozon_client_id_normalized(self) -> str:
+        """Ozon Client-Id as numeric string (parsed once per distinct value)"""
+        return normalize_ozon_client_id(self.ozon_client_id)
+    
     class Config:
         env_file = ".env"
+        env_file_encoding = "utf-8"
         case_sensitive = False
 
 
-settings = Settings()
+@lru_cache
+def get_settings() -> Settings:
+    """Settings are read from env/.env once per process"""
+    return Settings()
+
+
+settings = get_settings()
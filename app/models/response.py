@@ -2,7 +2,6 @@
 from datetime import datetime
 from sqlalchemy import Column, Integer, String, Text, DateTime, ForeignKey, Boolean, Enum as SQLEnum
 import enum
-from sqlalchemy.orm import relationship
 from app.database import Base
 
 
@@ -1,6 +1,6 @@
 """Review model"""
 from datetime import datetime
-from sqlalchemy import Column, Integer, String, Text, DateTime, Boolean
+from sqlalchemy import Column, Integer, String, Text, DateTime, Boolean, Index
 from app.database import Base
 
 
@@ -8,6 +8,10 @@ class Review(Base):
     """Review from Ozon marketplace"""
     
     __tablename__ = "reviews"
+    __table_args__ = (
+        # Covers the answered filter + created_at ordering of review lists
+        Index("ix_reviews_answered_created_at", "answered", "created_at"),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     ozon_review_id = Column(String, unique=True, index=True)  # Unique ID from Ozon
@@ -1,6 +1,6 @@
 """Response schemas"""
 from datetime import datetime
-from pydantic import BaseModel
+from pydantic import BaseModel, ConfigDict
 from typing import Optional
 
 
@@ -12,8 +12,7 @@ class ResponseDraftSchema(BaseModel):
     variant_number: int
     is_selected: bool = False
     
-    class Config:
-        from_attributes = True
+    model_config = ConfigDict(from_attributes=True)
 
 
 class ResponseSchema(BaseModel):
@@ -27,8 +26,7 @@ class ResponseSchema(BaseModel):
     sent_at: Optional[datetime] = None
     error_message: Optional[str] = None
     
-    class Config:
-        from_attributes = True
+    model_config = ConfigDict(from_attributes=True)
 
 
 class ResponseCreateSchema(BaseModel):
@@ -1,7 +1,7 @@
 """Review schemas"""
 from datetime import datetime
 from typing import Optional
-from pydantic import BaseModel
+from pydantic import BaseModel, ConfigDict
 
 
 class ReviewSchema(BaseModel):
@@ -17,8 +17,7 @@ class ReviewSchema(BaseModel):
     answered: bool = False
     created_at: datetime
     
-    class Config:
-        from_attributes = True
+    model_config = ConfigDict(from_attributes=True)
 
 
 class ReviewDetail(ReviewSchema):
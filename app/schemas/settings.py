@@ -1,5 +1,5 @@
 """Settings schemas"""
-from pydantic import BaseModel
+from pydantic import BaseModel, ConfigDict
 
 
 class SettingsSchema(BaseModel):
@@ -7,5 +7,4 @@ class SettingsSchema(BaseModel):
     key: str
     value: str
     
-    class Config:
-        from_attributes = True
+    model_config = ConfigDict(from_attributes=True)
@@ -1,7 +1,7 @@
 """OpenAI API integration service for draft generation"""
 import logging
 import asyncio
-from typing import Optional, List, Dict, Any
+from typing import Optional, List, Dict, Any, Tuple
 from openai import AsyncOpenAI, APIError, RateLimitError
 try:  # Optional: older versions may not expose AuthenticationError
     from openai import AuthenticationError
@@ -45,12 +45,44 @@ Signature: {signature}
 
 Response draft #{variant}:"""
     
+    # One client (and connection pool) per configured API key, shared by all instances.
+    # Other keys (e.g. tested via /test-openai) get a client of their own, see close()
+    _clients: Dict[str, AsyncOpenAI] = {}
+    
     def __init__(self, api_key: Optional[str] = None, model: Optional[str] = None):
         self.api_key = api_key or settings.openai_api_key
         self.model = model or settings.openai_model
-        self.client = AsyncOpenAI(api_key=self.api_key) if self._has_key() else None
+        self._owns_client = self._has_key() and self.api_key != settings.openai_api_key
+        if not self._has_key():
+            self.client = None
+        elif self._owns_client:
+            self.client = AsyncOpenAI(api_key=self.api_key)
+        else:
+            self.client = self._get_client(self.api_key)
         self.quota_exceeded = False  # Track quota state
 
+    @classmethod
+    def _get_client(cls, api_key: str) -> AsyncOpenAI:
+        """Shared AsyncOpenAI client for the key"""
+        client = cls._clients.get(api_key)
+        if client is None:
+            client = AsyncOpenAI(api_key=api_key)
+            cls._clients[api_key] = client
+        return client
+
+    async def close(self):
+        """Close this instance's own client (no-op for the shared one)"""
+        if self._owns_client:
+            await self.client.close()
+
+    @classmethod
+    async def aclose(cls):
+        """Close shared OpenAI clients (app shutdown)"""
+        clients = list(cls._clients.values())
+        cls._clients.clear()
+        for client in clients:
+            await client.close()
+
     def _has_key(self) -> bool:
         """Check if API key is configured (not placeholder)"""
         if not self.api_key:
@@ -242,6 +274,14 @@ Response draft #{variant}:"""
             logger.error(f"Unexpected error in categorization: {e}")
             return None
     
+    async def analyze_and_categorize(self, review_text: str) -> Tuple[Optional[str], Optional[str]]:
+        """Sentiment and category requested concurrently"""
+        sentiment, category = await asyncio.gather(
+            self.analyze_sentiment(review_text),
+            self.categorize_review(review_text)
+        )
+        return sentiment, category
+    
     async def generate_response_drafts(
         self,
         review_text: str,
@@ -264,54 +304,66 @@ Response draft #{variant}:"""
         tone = tone or settings.response_tone
         signature = signature or settings.response_signature
         
-        drafts = []
+        # Variants are independent requests: run them concurrently, keep order
+        results = await asyncio.gather(*(
+            self._generate_draft_variant(review_text, tone, signature, variant)
+            for variant in range(1, min(num_variants + 1, 4))
+        ))
+        return [draft for draft in results if draft]
+    
+    async def _generate_draft_variant(
+        self,
+        review_text: str,
+        tone: str,
+        signature: str,
+        variant: int
+    ) -> Optional[str]:
+        """Generate one draft variant; None on failure"""
+        if self.quota_exceeded:
+            return None
         
-        for variant in range(1, min(num_variants + 1, 4)):
-            try:
-                response = await asyncio.wait_for(
-                    self.client.chat.completions.create(
-                        model=self.model,
-                        messages=[
-                            {
-                                "role": "user",
-                                "content": self.RESPONSE_PROMPT.format(
-                                    review_text=review_text,
-                                    tone=tone,
-                                    signature=signature,
-                                    variant=variant
-                                )
-                            }
-                        ],
-                        max_tokens=300,
-                        temperature=0.7
-                    ),
-                    timeout=settings.ai_timeout
-                )
-                draft = response.choices[0].message.content.strip()
-                drafts.append(draft)
-                
-            except RateLimitError:
+        try:
+            response = await asyncio.wait_for(
+                self.client.chat.completions.create(
+                    model=self.model,
+                    messages=[
+                        {
+                            "role": "user",
+                            "content": self.RESPONSE_PROMPT.format(
+                                review_text=review_text,
+                                tone=tone,
+                                signature=signature,
+                                variant=variant
+                            )
+                        }
+                    ],
+                    max_tokens=300,
+                    temperature=0.7
+                ),
+                timeout=settings.ai_timeout
+            )
+            return response.choices[0].message.content.strip()
+            
+        except RateLimitError:
+            self.quota_exceeded = True
+            logger.warning(f"OpenAI quota exceeded at draft variant {variant}")
+            return None
+            
+        except APIError as e:
+            if "insufficient_quota" in str(e).lower():
                 self.quota_exceeded = True
                 logger.warning(f"OpenAI quota exceeded at draft variant {variant}")
-                break
-                
-            except APIError as e:
-                if "insufficient_quota" in str(e).lower():
-                    self.quota_exceeded = True
-                    logger.warning(f"OpenAI quota exceeded at draft variant {variant}")
-                    break
-                logger.error(f"Error generating draft variant {variant}: {e}")
-                continue
-                
-            except asyncio.TimeoutError:
-                logger.warning(f"Draft generation timeout at variant {variant}")
-                continue
-                
-            except Exception as e:
-                logger.error(f"Unexpected error generating draft variant {variant}: {e}")
-                continue
-        
-        return drafts
+                return None
+            logger.error(f"Error generating draft variant {variant}: {e}")
+            return None
+            
+        except asyncio.TimeoutError:
+            logger.warning(f"Draft generation timeout at variant {variant}")
+            return None
+            
+        except Exception as e:
+            logger.error(f"Unexpected error generating draft variant {variant}: {e}")
+            return None
     
     def validate_api_key(self) -> bool:
         """Check if API key is set"""
@@ -1,6 +1,5 @@
 """Auto response generation service"""
 import logging
-import asyncio
 from app.config import settings
 from app.services.ai_service import AIService
 from app.services.yandex_service import YandexGPTService
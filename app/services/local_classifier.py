@@ -0,0 +1,92 @@
+"""Local sentiment/category classifier (int8 ONNX models, optional)"""
+import logging
+import os
+from typing import Any, Dict, List, Optional, Tuple
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+class LocalClassifier:
+    """
+    Two text-classification heads run with ONNX Runtime on CPU
+
+    Expects settings.local_classifier_dir to hold sentiment.onnx, category.onnx
+    (exported with optimum, quantized with quantize_dynamic) and tokenizer.json.
+    onnxruntime, tokenizers and numpy are imported only when the dir is set.
+    """
+
+    SENTIMENT_LABELS = ("positive", "neutral", "negative")
+    CATEGORY_LABELS = ("quality", "delivery", "packaging", "service", "other")
+    MAX_LENGTH = 256
+
+    # One loaded classifier (or None if loading failed) per model dir
+    _instances: Dict[str, Optional["LocalClassifier"]] = {}
+
+    def __init__(self, model_dir: str, min_confidence: float):
+        import numpy as np
+        import onnxruntime as ort
+        from tokenizers import Tokenizer
+
+        self._np = np
+        self.min_confidence = min_confidence
+
+        self._tokenizer = Tokenizer.from_file(os.path.join(model_dir, "tokenizer.json"))
+        self._tokenizer.enable_truncation(max_length=self.MAX_LENGTH)
+        self._tokenizer.enable_padding()
+
+        options = ort.SessionOptions()
+        options.intra_op_num_threads = 1
+        self._sentiment_session = ort.InferenceSession(
+            os.path.join(model_dir, "sentiment.onnx"), sess_options=options, providers=["CPUExecutionProvider"]
+        )
+        self._category_session = ort.InferenceSession(
+            os.path.join(model_dir, "category.onnx"), sess_options=options, providers=["CPUExecutionProvider"]
+        )
+
+    @classmethod
+    def get(cls) -> Optional["LocalClassifier"]:
+        """Classifier for the configured dir; None if not configured or not loadable"""
+        model_dir = settings.local_classifier_dir
+        if not model_dir:
+            return None
+        if model_dir not in cls._instances:
+            try:
+                cls._instances[model_dir] = cls(model_dir, settings.local_classifier_min_confidence)
+                logger.info("Local classifier loaded from %s", model_dir)
+            except ImportError as e:
+                logger.warning("Local classifier disabled: %s (pip install onnxruntime tokenizers)", e)
+                cls._instances[model_dir] = None
+            except Exception as e:
+                logger.warning("Local classifier disabled: cannot load %s: %s", model_dir, e)
+                cls._instances[model_dir] = None
+        return cls._instances[model_dir]
+
+    def predict_batch(self, texts: List[str]) -> List[Optional[Tuple[str, str]]]:
+        """(sentiment, category) per text; None where either head is below min_confidence"""
+        if not texts:
+            return []
+        encodings = self._tokenizer.encode_batch(texts)
+        features = {
+            "input_ids": self._np.array([e.ids for e in encodings], dtype=self._np.int64),
+            "attention_mask": self._np.array([e.attention_mask for e in encodings], dtype=self._np.int64),
+            "token_type_ids": self._np.array([e.type_ids for e in encodings], dtype=self._np.int64),
+        }
+        sentiments = self._run(self._sentiment_session, features, self.SENTIMENT_LABELS)
+        categories = self._run(self._category_session, features, self.CATEGORY_LABELS)
+        return [
+            (sentiment, category) if sentiment and category else None
+            for sentiment, category in zip(sentiments, categories)
+        ]
+
+    def _run(self, session: Any, features: Dict[str, Any], labels: Tuple[str, ...]) -> List[Optional[str]]:
+        """Top label per row, or None if its softmax probability is too low"""
+        inputs = {i.name: features[i.name] for i in session.get_inputs() if i.name in features}
+        logits = session.run(None, inputs)[0]
+        exp = self._np.exp(logits - logits.max(axis=1, keepdims=True))
+        probs = exp / exp.sum(axis=1, keepdims=True)
+        best = probs.argmax(axis=1)
+        return [
+            labels[i] if probs[row, i] >= self.min_confidence else None
+            for row, i in enumerate(best)
+        ]
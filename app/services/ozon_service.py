@@ -1,8 +1,12 @@
 """Ozon API integration service"""
+import asyncio
 import httpx
 import logging
-from typing import Optional, List, Dict, Any
-from app.config import settings
+import math
+from datetime import datetime, timedelta, timezone
+from functools import lru_cache
+from typing import Optional, List, Dict, Any, AsyncIterator, Tuple
+from app.config import settings, normalize_ozon_client_id
 
 logger = logging.getLogger(__name__)
 
@@ -12,25 +16,55 @@ class OzonService:
     
     BASE_URL = "https://api-seller.ozon.ru"
     
+    # Review list endpoint that last answered 200 in this process
+    _working_reviews_endpoint: Optional[str] = None
+    
     def __init__(self, client_id: Optional[str] = None, api_key: Optional[str] = None):
-        # Ozon requires Client-Id to be a numeric string
-        client_id_value = client_id or settings.ozon_client_id
-        try:
-            # Ensure Client-Id is numeric (Ozon API requirement)
-            self.client_id = str(int(str(client_id_value).strip()))
-        except (ValueError, TypeError):
-            self.client_id = str(client_id_value).strip()
-        
+        self.set_credentials(client_id, api_key)
+        # One pooled client per service keeps TLS sessions alive between calls
+        self._client = httpx.AsyncClient(
+            timeout=httpx.Timeout(30.0, connect=5.0),
+            http2=True,
+            limits=httpx.Limits(max_keepalive_connections=10, max_connections=20)
+        )
+        logger.info(f"OzonService initialized with Client-Id: {self.client_id}")
+
+    def set_credentials(self, client_id: Optional[str] = None, api_key: Optional[str] = None):
+        """Apply credentials (falls back to settings)"""
+        if client_id:
+            self.client_id = normalize_ozon_client_id(client_id)
+        else:
+            self.client_id = settings.ozon_client_id_normalized
         self.api_key = str(api_key or settings.ozon_api_key).strip()
-        self.headers = {
-            "Client-Id": self.client_id,
-            "Api-Key": self.api_key,
+        self.headers = self._default_headers(self.client_id, self.api_key)
+
+    @classmethod
+    @lru_cache(maxsize=8)
+    def _default_headers(cls, client_id: str, api_key: str) -> Dict[str, str]:
+        """Request headers for given credentials (cached, do not mutate)"""
+        return {
+            "Client-Id": client_id,
+            "Api-Key": api_key,
             "Content-Type": "application/json",
             "Accept": "application/json"
         }
-        logger.info(f"OzonService initialized with Client-Id: {self.client_id}")
+
+    async def aclose(self):
+        """Close pooled HTTP connections"""
+        await self._client.aclose()
+    
+    @staticmethod
+    def _date_from(days_back: int) -> str:
+        """UTC timestamp `days_back` days ago in Ozon filter format"""
+        return (datetime.now(timezone.utc) - timedelta(days=days_back)).strftime("%Y-%m-%dT%H:%M:%SZ")
     
-    async def get_reviews(self, limit: int = 100, offset: int = 0, days_back: int = 30) -> Optional[Dict[str, Any]]:
+    async def get_reviews(
+        self,
+        limit: int = 100,
+        offset: int = 0,
+        days_back: int = 30,
+        date_from: Optional[str] = None
+    ) -> Optional[Dict[str, Any]]:
         """
         Fetch reviews from Ozon API - ONLY 100 LATEST FRESH REVIEWS
         
@@ -38,6 +72,7 @@ class OzonService:
             limit: Always 100 (fixed to get only latest reviews)
             offset: Number of reviews to skip (deprecated, use days_back)
             days_back: Number of days back to fetch reviews (default 30, set to 0 for all)
+            date_from: Precomputed filter start (overrides days_back), see _date_from
             
         Returns:
             List of reviews or None if error
@@ -51,16 +86,20 @@ class OzonService:
                 f"{self.BASE_URL}/v1/review/list",  # v1 - correct endpoint
                 f"{self.BASE_URL}/v2/review/list",  # v2 alternative
             ]
+            # Skip re-probing: start with the endpoint that worked before
+            working = OzonService._working_reviews_endpoint
+            if working:
+                endpoints = [working] + [url for url in endpoints if url != working]
             
             # Build filter with date range for fresher reviews
             filter_config = {"statuses": [1]}
             
             # If days_back is specified, add date filter
-            if days_back > 0:
-                from datetime import datetime, timedelta
-                date_from = (datetime.utcnow() - timedelta(days=days_back)).isoformat() + "Z"
+            if date_from is None and days_back > 0:
+                date_from = self._date_from(days_back)
+            if date_from:
                 filter_config["date_from"] = date_from
-                logger.info(f"Filtering reviews from last {days_back} days (since {date_from})")
+                logger.debug(f"Filtering reviews from last {days_back} days (since {date_from})")
             
             payload = {
                 "limit": limit,
@@ -68,56 +107,124 @@ class OzonService:
                 "filter": filter_config
             }
             
-            async with httpx.AsyncClient(timeout=30) as client:
-                for url in endpoints:
-                    logger.info(f"Trying endpoint: {url}")
-                    logger.info(f"Headers: Client-Id={self.client_id}, Api-Key={'*' * len(self.api_key)}")
-                    try:
-                        response = await client.post(
-                            url,
-                            headers=self.headers,
-                            json=payload
-                        )
-                        
-                        logger.info(f"Response status: {response.status_code}")
-                        logger.info(f"Response text: {response.text[:500]}")
-                        
-                        if response.status_code == 200:
-                            logger.info("✅ Success with " + url)
-                            data = response.json()
+            debug = logger.isEnabledFor(logging.DEBUG)
+            for url in endpoints:
+                if debug:
+                    logger.debug(f"Trying endpoint: {url}")
+                    logger.debug(f"Headers: Client-Id={self.client_id}, Api-Key={'*' * len(self.api_key)}")
+                try:
+                    response = await self._client.post(
+                        url,
+                        headers=self.headers,
+                        json=payload
+                    )
+                    
+                    if debug:
+                        logger.debug(f"Response status: {response.status_code}")
+                        logger.debug(f"Response text: {response.text[:500]}")
+                    
+                    if response.status_code == 200:
+                        logger.info("✅ Success with " + url)
+                        OzonService._working_reviews_endpoint = url
+                        data = response.json()
 
-                            # Ozon часто возвращает данные под ключом "result"
-                            if isinstance(data, dict) and "reviews" not in data:
-                                nested = data.get("result")
-                                if isinstance(nested, dict) and "reviews" in nested:
-                                    reviews = nested.get("reviews", [])
-                                    total = nested.get("count") or nested.get("total")
-                                    data["reviews"] = reviews
-                                    if total is not None:
-                                        data["total"] = total
-                                    logger.info(f"Unwrapped result: {len(reviews)} reviews")
+                        # Ozon часто возвращает данные под ключом "result"
+                        if isinstance(data, dict) and "reviews" not in data:
+                            nested = data.get("result")
+                            if isinstance(nested, dict) and "reviews" in nested:
+                                reviews = nested.get("reviews", [])
+                                total = nested.get("count") or nested.get("total")
+                                data["reviews"] = reviews
+                                if total is not None:
+                                    data["total"] = total
+                                logger.debug(f"Unwrapped result: {len(reviews)} reviews")
 
-                            return data
-                        elif response.status_code == 404:
-                            logger.info(f"404 - Trying next endpoint...")
-                            continue
-                        else:
-                            logger.warning(f"Status {response.status_code}: {response.text[:200]}")
-                            # Don't continue on other errors, return the response
-                            if response.status_code < 500:
-                                logger.warning(f"Client error, stopping retry loop")
-                                return None
-                    except Exception as e:
-                        logger.warning(f"Failed with {url}: {e}")
+                        return data
+                    elif response.status_code == 404:
+                        logger.debug(f"404 - Trying next endpoint...")
                         continue
-                
-                logger.error("All endpoints failed")
-                return None
-                
+                    else:
+                        logger.warning(f"Status {response.status_code}: {response.text[:200]}")
+                        # Don't continue on other errors, return the response
+                        if response.status_code < 500:
+                            logger.warning(f"Client error, stopping retry loop")
+                            return None
+                except Exception as e:
+                    logger.warning(f"Failed with {url}: {e}")
+                    continue
+            
+            logger.error("All endpoints failed")
+            return None
+            
         except Exception as e:
             logger.error(f"Error fetching reviews from Ozon: {e}", exc_info=True)
             return None
     
+    @staticmethod
+    def extract_reviews(result: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """Get the review list from a get_reviews result (direct or nested)"""
+        reviews = result.get("reviews", [])
+        if not reviews:
+            nested = result.get("result")
+            if isinstance(nested, dict):
+                reviews = nested.get("reviews", [])
+        return reviews
+
+    async def fetch_review_pages(
+        self,
+        max_pages: int = 10,
+        limit: int = 100,
+        days_back: int = 30,
+        concurrency: int = 5
+    ) -> AsyncIterator[Tuple[int, List[Dict[str, Any]], Optional[int]]]:
+        """
+        Yield (offset, reviews, total) pages in order, requesting up to `concurrency` pages at once
+        
+        The first page is fetched alone: if Ozon reports `total`, only the pages
+        needed to cover it are requested afterwards. Stops at the first failed,
+        empty or short page.
+        """
+        # Same window for every page of this run
+        date_from = self._date_from(days_back) if days_back > 0 else None
+        offset = 0
+        pages_left = max_pages
+        batch = 1
+        total = None
+        while pages_left > 0:
+            offsets = [offset + i * limit for i in range(min(batch, pages_left))]
+            results = await asyncio.gather(
+                *(self.get_reviews(limit=limit, offset=o, days_back=days_back, date_from=date_from) for o in offsets),
+                return_exceptions=True
+            )
+            
+            for page_offset, result in zip(offsets, results):
+                if isinstance(result, Exception) or not result:
+                    logger.warning(f"Failed to fetch reviews at offset {page_offset}")
+                    return
+                
+                if total is None and result.get("total") is not None:
+                    try:
+                        total = int(result["total"])
+                        pages_left = min(pages_left, math.ceil(total / limit))
+                    except (ValueError, TypeError):
+                        pass
+                
+                reviews = self.extract_reviews(result)
+                if not reviews:
+                    logger.info(f"No more reviews at offset {page_offset}")
+                    return
+                
+                yield page_offset, reviews, total
+                
+                # Stop if we got less than requested
+                if len(reviews) < limit:
+                    logger.info(f"Reached end of reviews at offset {page_offset}")
+                    return
+            
+            offset += len(offsets) * limit
+            pages_left -= len(offsets)
+            batch = concurrency
+    
     async def send_response(self, review_id: str, text: str) -> Optional[Dict[str, Any]]:
         """
         Send response (comment) to a review
@@ -140,46 +247,54 @@ class OzonService:
             }
             
             logger.info(f"Sending response to review {review_id}, text length: {len(text)}")
-            logger.info(f"Endpoint: {url}")
-            logger.info(f"Payload: {payload}")
-            
-            async with httpx.AsyncClient(timeout=30) as client:
-                logger.info(f"Trying endpoint: {url}")
-                response = await client.post(
-                    url,
-                    headers=self.headers,
-                    json=payload
-                )
-                
+            debug = logger.isEnabledFor(logging.DEBUG)
+            if debug:
+                logger.debug(f"Endpoint: {url}")
+                logger.debug(f"Payload: {payload}")
+            
+            response = await self._client.post(
+                url,
+                headers=self.headers,
+                json=payload
+            )
+            
+            if debug:
+                logger.debug(f"Response status: {response.status_code}")
+                logger.debug(f"Response body: {response.text[:500]}")
+            
+            if response.status_code == 200:
+                logger.info(f"✅ Response sent successfully!")
+                return {
+                    "ok": True,
+                    "data": response.json()
+                }
+            else:
                 body_preview = response.text[:500]
-                logger.info(f"Response status: {response.status_code}")
-                logger.info(f"Response body: {body_preview}")
+                logger.warning(f"Status {response.status_code}: {body_preview}")
+                return {
+                    "ok": False,
+                    "status_code": response.status_code,
+                    "text": body_preview
+                }
                 
-                if response.status_code == 200:
-                    logger.info(f"✅ Response sent successfully!")
-                    return {
-                        "ok": True,
-                        "data": response.json()
-                    }
-                else:
-                    logger.warning(f"Status {response.status_code}: {body_preview}")
-                    return {
-                        "ok": False,
-                        "status_code": response.status_code,
-                        "text": body_preview
-                    }
-                    
         except Exception as e:
             logger.error(f"Error sending response to Ozon: {e}", exc_info=True)
             return {
                 "ok": False,
                 "error": str(e)
             }
-            return {
-                "ok": False,
-                "error": str(e)
-            }
     
     def validate_credentials(self) -> bool:
         """Validate that API credentials are set"""
         return bool(self.client_id and self.api_key)
+
+
+_ozon_service: Optional[OzonService] = None
+
+
+def get_ozon_service() -> OzonService:
+    """Shared OzonService instance (dependency for endpoints and background tasks)"""
+    global _ozon_service
+    if _ozon_service is None:
+        _ozon_service = OzonService()
+    return _ozon_service
@@ -1,17 +1,29 @@
 """Business logic service for review management"""
 import logging
-from typing import Optional, List
+from threading import Lock
+from typing import Optional, List, Tuple
+from cachetools import TTLCache
 from sqlalchemy.orm import Session
 from app.models.review import Review
 from app.models.response import Response, ResponseDraft
 from app.services.ai_service import AIService
 from app.services.yandex_service import YandexGPTService
-from app.services.ozon_service import OzonService
+from app.services.ozon_service import get_ozon_service
 from app.services.auto_response_service import AutoResponseService
 from app.config import settings
 
 logger = logging.getLogger(__name__)
 
+# Dashboard aggregates (/api/reviews/stats, /products), cleared when reviews change
+stats_cache = TTLCache(maxsize=32, ttl=30)
+stats_cache_lock = Lock()
+
+
+def invalidate_stats_cache():
+    """Drop cached review aggregates"""
+    with stats_cache_lock:
+        stats_cache.clear()
+
 
 class ReviewService:
     """Service for managing reviews and responses"""
@@ -20,7 +32,7 @@ class ReviewService:
         self.db = db
         self.ai_service = AIService()
         self.yandex_service = YandexGPTService()
-        self.ozon_service = OzonService()
+        self.ozon_service = get_ozon_service()
     
     def _get_ai_service(self):
         """Get the currently configured AI service"""
@@ -39,67 +51,140 @@ class ReviewService:
         Returns:
             Created Review object or None if failed
         """
+        # Check if review already exists
+        existing = self.db.query(Review).filter(
+            Review.ozon_review_id == review_data.get("id")
+        ).first()
+        if existing:
+            return existing
+        
+        created = await self.process_new_reviews_batch([review_data])
+        return created[0] if created else None
+    
+    async def process_new_reviews_batch(self, reviews_data: List[dict]) -> List[Review]:
+        """
+        Save a page of reviews with a single commit and generate drafts for the new ones
+        
+        Args:
+            reviews_data: Review data from Ozon API
+            
+        Returns:
+            Newly created Review objects (reviews already in DB are skipped)
+        """
         try:
-            # Check if review already exists
-            existing = self.db.query(Review).filter(
-                Review.ozon_review_id == review_data.get("id")
-            ).first()
-            if existing:
-                return existing
-            
-            # Analyze sentiment and category using configured AI provider
-            review_text = review_data.get("text") or review_data.get("comment") or review_data.get("content") or ""
-            ai_service = self._get_ai_service()
-            sentiment = await ai_service.analyze_sentiment(review_text)
-            category = await ai_service.categorize_review(review_text)
-
-            # Detect already answered on marketplace to avoid double replies
-            # Ozon API response statuses:
-            # - "new" / "default" = no response yet
-            # - "processed" / "answered" / "commented" / "response" = seller has responded
-            status_raw = (review_data.get("status") or "").lower()
-            comments_amount = review_data.get("comments_amount") or 0
-            
-            # Debug: log what we received
-            logger.debug(f"Review check - ID: {review_data.get('id')}, comments_amount: {comments_amount}, status: {status_raw}")
-            
-            # If status is "commented" or "processed" = seller has responded
-            # If comments_amount > 0 = seller has a response
-            has_comments = int(comments_amount) > 0 if comments_amount else False
-            is_responded = status_raw in {"processed", "answered", "commented", "response"}
-            answered_flag = has_comments or is_responded
-            
-            logger.info(
-                f"Review {review_data.get('id')}: "
-                f"has_comments={has_comments}, is_responded={is_responded}, answered={answered_flag}"
-            )
+            # One query for all already stored reviews instead of one per review
+            ids = [r.get("id") for r in reviews_data if r.get("id")]
+            known_ids = set()
+            if ids:
+                known_ids = {
+                    row.ozon_review_id
+                    for row in self.db.query(Review.ozon_review_id).filter(Review.ozon_review_id.in_(ids))
+                }
             
-            # Create review record
-            review = Review(
-                ozon_review_id=review_data.get("id"),
-                product_id=review_data.get("product_id") or review_data.get("sku"),
-                product_name=review_data.get("product_name") or review_data.get("sku_name") or review_data.get("title"),
-                customer_name=review_data.get("customer_name") or review_data.get("author") or "Anonymous",
-                rating=review_data.get("rating", 0),
-                text=review_text,
-                sentiment=sentiment,
-                category=category,
-                answered=answered_flag
-            )
+            pending = []
+            for review_data in reviews_data:
+                ozon_review_id = review_data.get("id")
+                if ozon_review_id in known_ids:
+                    continue
+                known_ids.add(ozon_review_id)
+                pending.append(review_data)
             
-            self.db.add(review)
+            if not pending:
+                return []
+            
+            labels = await self._classify_texts([self._review_text(r) for r in pending])
+            new_reviews = [
+                self._build_review(review_data, sentiment, category)
+                for review_data, (sentiment, category) in zip(pending, labels)
+            ]
+            
+            self.db.add_all(new_reviews)
             self.db.commit()
-            self.db.refresh(review)
-
+            invalidate_stats_cache()
+            
+        except Exception as e:
+            logger.error(f"Error processing reviews batch: {e}")
+            self.db.rollback()
+            return []
+        
+        for review in new_reviews:
             # If already answered on marketplace, skip auto-generation
-            if answered_flag:
-                return review
+            if not review.answered:
+                await self._generate_initial_drafts(review)
+        
+        return new_reviews
+    
+    @staticmethod
+    def _review_text(review_data: dict) -> str:
+        """Review text from Ozon API data (field name varies between API versions)"""
+        return review_data.get("text") or review_data.get("comment") or review_data.get("content") or ""
+    
+    async def _classify_texts(self, texts: List[str]) -> List[Tuple[str, str]]:
+        """(sentiment, category) per text using configured AI provider"""
+        ai_service = self._get_ai_service()
+        if isinstance(ai_service, YandexGPTService):
+            # Several reviews per API call across the whole page
+            try:
+                return await ai_service.classify_batch(texts)
+            except Exception as e:
+                logger.warning(f"Review analysis failed: {e}")
+                return [("neutral", "other")] * len(texts)
+        
+        labels = []
+        for review_text in texts:
+            try:
+                labels.append(await ai_service.analyze_and_categorize(review_text))
+            except Exception as e:
+                # One failed review doesn't drop the page
+                logger.warning(f"Review analysis failed: {e}")
+                labels.append(("neutral", "other"))
+        return labels
+    
+    def _build_review(self, review_data: dict, sentiment: str, category: str) -> Review:
+        """Build (unsaved) Review record from Ozon API data and its analysis"""
+        review_text = self._review_text(review_data)
 
+        # Detect already answered on marketplace to avoid double replies
+        # Ozon API response statuses:
+        # - "new" / "default" = no response yet
+        # - "processed" / "answered" / "commented" / "response" = seller has responded
+        status_raw = (review_data.get("status") or "").lower()
+        comments_amount = review_data.get("comments_amount") or 0
+        
+        # Debug: log what we received
+        logger.debug(f"Review check - ID: {review_data.get('id')}, comments_amount: {comments_amount}, status: {status_raw}")
+        
+        # If status is "commented" or "processed" = seller has responded
+        # If comments_amount > 0 = seller has a response
+        has_comments = int(comments_amount) > 0 if comments_amount else False
+        is_responded = status_raw in {"processed", "answered", "commented", "response"}
+        answered_flag = has_comments or is_responded
+        
+        logger.info(
+            f"Review {review_data.get('id')}: "
+            f"has_comments={has_comments}, is_responded={is_responded}, answered={answered_flag}"
+        )
+        
+        return Review(
+            ozon_review_id=review_data.get("id"),
+            product_id=review_data.get("product_id") or review_data.get("sku"),
+            product_name=review_data.get("product_name") or review_data.get("sku_name") or review_data.get("title"),
+            customer_name=review_data.get("customer_name") or review_data.get("author") or "Anonymous",
+            rating=review_data.get("rating", 0),
+            text=review_text,
+            sentiment=sentiment,
+            category=category,
+            answered=answered_flag
+        )
+    
+    async def _generate_initial_drafts(self, review: Review):
+        """Generate auto-response and draft variants for a freshly saved review"""
+        try:
             # Auto-generate single draft (configurable)
             start_variant = 1
             if settings.auto_response_enabled:
                 auto_service = AutoResponseService()
-                auto_result = await auto_service.generate_response(review_text)
+                auto_result = await auto_service.generate_response(review.text)
                 ai_text = None
                 if isinstance(auto_result, dict):
                     ai_text = auto_result.get('response') or auto_result.get('text') or auto_result.get('response_text')
@@ -114,14 +199,11 @@ class ReviewService:
                     start_variant = 2
             
             # Generate additional response drafts
-            await self.generate_response_drafts(review.id, review_text, start_variant=start_variant)
-            
-            return review
+            await self.generate_response_drafts(review.id, review.text, start_variant=start_variant)
             
         except Exception as e:
-            logger.error(f"Error processing review: {e}")
+            logger.error(f"Error generating initial drafts: {e}")
             self.db.rollback()
-            return None
     
     async def generate_response_drafts(
         self,
@@ -228,6 +310,8 @@ class ReviewService:
             if success:
                 review.answered = True
             self.db.commit()
+            if success:
+                invalidate_stats_cache()
             self.db.refresh(response)
             
             return response
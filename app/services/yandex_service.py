@@ -1,13 +1,166 @@
 """YandexGPT API integration service for draft generation"""
 import logging
 import asyncio
+import hashlib
+import os
+import random
+import re
+import time
+from functools import lru_cache
 import httpx
-from typing import Optional, List, Dict, Any
+import orjson
+from typing import Optional, List, Dict, Any, AsyncIterator, Awaitable, Callable, Tuple
+from cachetools import TTLCache
 from app.config import settings
+from app.services.local_classifier import LocalClassifier
 
 logger = logging.getLogger(__name__)
 
 
+class AsyncTokenBucket:
+    """Token bucket rate limiter shared by coroutines"""
+    
+    def __init__(self, rate: float, capacity: Optional[float] = None):
+        self.rate = rate
+        # acquire() takes whole tokens: a bucket under 1 (rate < 1 rps) would never fill
+        self.capacity = max(1.0, capacity or rate)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+    
+    async def acquire(self):
+        """Wait for a token and take it (no-op if rate is not positive)"""
+        if self.rate <= 0:
+            return
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+@lru_cache(maxsize=32)
+def _completion_options(temperature: float, max_tokens: int, stream: bool) -> Dict[str, Any]:
+    """Static part of the request body; shared, never mutated"""
+    return {"stream": stream, "temperature": temperature, "maxTokens": max_tokens}
+
+
+class AdaptiveConcurrencyLimiter:
+    """
+    Concurrency limit adjusted from API feedback (AIMD)
+    
+    Halves on overload (429/503), grows by one after `limit` successes in a row,
+    never above max_limit. Uses a Condition counter because resizing an
+    asyncio.Semaphore is not supported.
+    """
+    
+    def __init__(self, max_limit: int, min_limit: int = 1):
+        self.min_limit = max(1, min_limit)
+        self.max_limit = max(self.min_limit, max_limit)
+        self.limit = self.max_limit
+        self.active = 0
+        self._successes = 0
+        self._cond = asyncio.Condition()
+    
+    async def __aenter__(self):
+        async with self._cond:
+            await self._cond.wait_for(lambda: self.active < self.limit)
+            self.active += 1
+        return self
+    
+    async def __aexit__(self, *exc_info):
+        async with self._cond:
+            self.active -= 1
+            # Wakes waiters for the freed slot and any limit increase
+            self._cond.notify_all()
+    
+    def record_success(self):
+        """Count a successful call; raise the limit by one after a full window of them"""
+        self._successes += 1
+        if self._successes >= self.limit and self.limit < self.max_limit:
+            self.limit += 1
+            self._successes = 0
+    
+    def record_overload(self):
+        """Halve the limit after a 429/503"""
+        self._successes = 0
+        new_limit = max(self.min_limit, self.limit // 2)
+        if new_limit != self.limit:
+            logger.warning("YandexGPT concurrency limit lowered %d -> %d", self.limit, new_limit)
+            self.limit = new_limit
+
+
+class AsyncBatcher:
+    """
+    Coalesces concurrent single-item calls into batch calls
+    
+    Items queued within max_queue_time seconds (or until max_batch_size is reached)
+    are passed together to process_batch, which must return one result per item.
+    At most `concurrency` batches run at once.
+    """
+    
+    def __init__(
+        self,
+        process_batch: Callable[[List[Any]], Awaitable[List[Any]]],
+        max_batch_size: int = 16,
+        max_queue_time: float = 0.05,
+        concurrency: int = 4
+    ):
+        self._process_batch = process_batch
+        self.max_batch_size = max_batch_size
+        self.max_queue_time = max_queue_time
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self._pending: List[Tuple[Any, asyncio.Future]] = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._tasks: set = set()
+    
+    async def process(self, item: Any) -> Any:
+        """Queue an item and wait for its result"""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((item, future))
+        if len(self._pending) >= self.max_batch_size:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.max_queue_time, self._flush)
+        return await future
+    
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if not self._pending:
+            return
+        batch, self._pending = self._pending, []
+        task = asyncio.create_task(self._run(batch))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+    
+    async def _run(self, batch: List[Tuple[Any, asyncio.Future]]):
+        async with self._semaphore:
+            try:
+                results = await self._process_batch([item for item, _ in batch])
+            except Exception as e:
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                return
+        for (_, future), result in zip(batch, results):
+            # A waiter may have been cancelled meanwhile
+            if not future.done():
+                future.set_result(result)
+    
+    async def aclose(self):
+        """Send queued items now and wait for running batches"""
+        self._flush()
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+
+
 class YandexGPTService:
     """Service for generating response drafts using YandexGPT"""
     
@@ -20,11 +173,76 @@ class YandexGPTService:
     # REST endpoint for chat-style completion
     API_URL = "https://llm.api.cloud.yandex.net/foundationModels/v1/completion"
     
-    SENTIMENT_PROMPT = """Проанализируй тональность отзыва и ответь ТОЛЬКО одним словом: положительная, нейтральная или отрицательная.
-Отзыв: {review_text}"""
+    # Connection pool shared by all instances (created lazily, see _get_client)
+    _client: Optional[httpx.AsyncClient] = None
     
-    CATEGORY_PROMPT = """Категоризируй основную тему отзыва. Ответь ТОЛЬКО одной категорией: качество, доставка, упаковка, сервис, другое.
-Отзыв: {review_text}"""
+    # Process-wide limits so concurrent callers stay within the folder quota.
+    # Created in the running loop (see _get_limits): on Python 3.9 asyncio primitives
+    # bind to the loop current at construction, which at import time is not the server's
+    _concurrency: Optional[AdaptiveConcurrencyLimiter] = None
+    _rate_limiter: Optional[AsyncTokenBucket] = None
+    _limits_loop: Optional[asyncio.AbstractEventLoop] = None
+    
+    # (sentiment, category) is a pure function of (model, review text); keyed by normalized text
+    _classify_cache = TTLCache(maxsize=10000, ttl=3600)
+    
+    # Last successful health check per (api_key, folder_id, model); failures are never cached
+    _health_cache = TTLCache(maxsize=16, ttl=30)
+    
+    # Quota is tracked per kind of call, so rate-limited drafts don't stop classification.
+    # After QUOTA_429_THRESHOLD 429s in a row a kind pauses for QUOTA_COOLDOWN seconds,
+    # doubling for each further cooldown without a success in between (up to QUOTA_MAX_COOLDOWN)
+    QUOTA_KINDS = ("classify", "draft")
+    QUOTA_429_THRESHOLD = 8
+    QUOTA_COOLDOWN = 300.0
+    QUOTA_MAX_COOLDOWN = 3600.0
+    _consecutive_429: Dict[str, int] = {}
+    _quota_strikes: Dict[str, int] = {}
+    _quota_until: Dict[str, float] = {}
+    
+    # classify() calls from concurrent callers are sent as micro-batches, per credentials/model
+    _classify_batchers: Dict[tuple, AsyncBatcher] = {}
+    
+    # Identical concurrent calls share one request (single-flight)
+    _inflight: Dict[bytes, asyncio.Future] = {}
+    
+    _WHITESPACE_RE = re.compile(r"\s+")
+    _REPEATED_PUNCT_RE = re.compile(r"([!?.,)(…])\1+")
+    _DRAFT_LABEL_RE = re.compile(r"^\s*(?:вариант(?: ответа)?\s*#?\s*\d+\s*[:.)]\s*)", re.I)
+    _CLASSIFY_RE = re.compile(r"SENTIMENT\s*=\s*(\w+)\s*;\s*CATEGORY\s*=\s*(\w+)", re.I)
+    _CLASSIFY_LINE_RE = re.compile(
+        r"^\s*(\d+)\s*[:.)]\s*SENTIMENT\s*=\s*(\w+)\s*;\s*CATEGORY\s*=\s*(\w+)", re.I | re.M
+    )
+    
+    # Answer parsing: sentiment classes checked in priority order
+    _SENTIMENT_PATTERNS = [
+        (re.compile(r"положительная|positive|хорошо|good", re.I), "positive"),
+        (re.compile(r"отрицательная|negative|плохо|bad", re.I), "negative"),
+    ]
+    # One pass for all categories: the group name of the first match is the category
+    _CATEGORY_RE = re.compile(
+        r"(?P<quality>качество|quality)"
+        r"|(?P<delivery>доставка|delivery)"
+        r"|(?P<packaging>упаковка|packaging)"
+        r"|(?P<service>сервис|service)",
+        re.I
+    )
+    
+    # 400 messages that point at the folder ID / model rather than at the probe request
+    _BAD_SETUP_RE = re.compile(r"folder|model|uri", re.I)
+    
+    # Retries for 429 / 5xx: exponential backoff with jitter unless Retry-After is given
+    MAX_RETRIES = 3
+    RETRY_BASE_DELAY = 1.0  # seconds
+    RETRY_MAX_DELAY = 30.0
+    RETRY_JITTER = 0.5
+    
+    # Several reviews per request: one numbered answer line per review
+    COMBINED_CLASSIFY_BATCH_PROMPT = """Для каждого отзыва определи тональность и основную тему.
+Ответь СТРОГО одной строкой на отзыв в формате 'N: SENTIMENT=<positive|neutral|negative>;CATEGORY=<quality|delivery|packaging|service|other>', где N — номер отзыва, без пояснений.
+
+{reviews}"""
+    CLASSIFY_BATCH_SIZE = 10
     
     RESPONSE_PROMPT = """Сгенерируй помощный ответ продавца на отзыв клиента для маркетплейса.
 Требования:
@@ -40,15 +258,100 @@ class YandexGPTService:
 
 Вариант ответа #{variant}:"""
     
+    # Everything before the variant number; formatted once per review
+    RESPONSE_PROMPT_HEAD = RESPONSE_PROMPT[:RESPONSE_PROMPT.index("{variant}")]
+    
+    # All variants from one completion, separated by DRAFTS_DELIMITER
+    DRAFTS_DELIMITER = "==="
+    MULTI_RESPONSE_PROMPT = """Сгенерируй {num_variants} разных вариантов ответа продавца на отзыв клиента для маркетплейса.
+Требования:
+- Будь вежлив и эмпатичен
+- Будь кратким (максимум 2-3 предложения)
+- Не запрашивай личную информацию
+- Не спорь и не делай оправдания
+- Тон: {tone}
+- Включи подпись если предоставлена
+- Выведи только тексты ответов без нумерации и заголовков, разделяя их строкой ===
+
+Отзыв: {review_text}
+Подпись: {signature}"""
+    MAX_TOKENS_PER_DRAFT = 200
+    # Temperature of the extra call made when variants came back duplicated or missing
+    DRAFT_FILL_TEMPERATURE = 0.9
+    
     def __init__(self, api_key: Optional[str] = None, folder_id: Optional[str] = None, model: Optional[str] = None):
         self.api_key = api_key or settings.yandex_api_key
         self.folder_id = folder_id or settings.yandex_folder_id
         self.model = model or settings.yandex_model
-        self.quota_exceeded = False
+        # Yandex requires /latest suffix on model URI
+        self._model_uri = f"gpt://{self.folder_id}/{self.model}/latest"
+        self._headers = {
+            "Authorization": f"Api-Key {self.api_key}",
+            "Content-Type": "application/json"
+        }
         
         # Debug logging
         logger.info(f"YandexGPT init: api_key={'SET' if self.api_key else 'EMPTY'}, folder_id={self.folder_id}, model={self.model}")
 
+    @property
+    def quota_exceeded(self) -> bool:
+        """True while any kind of call is in quota cooldown (shared by all instances)"""
+        return any(self._quota_active(kind) for kind in self.QUOTA_KINDS)
+    
+    def _quota_active(self, kind: str) -> bool:
+        """True while calls of this kind are paused after repeated 429s"""
+        return time.monotonic() < self._quota_until.get(kind, 0.0)
+    
+    def _record_rate_limited(self, kind: str):
+        """Count a 429; start the kind's quota cooldown once they keep coming"""
+        count = self._consecutive_429.get(kind, 0) + 1
+        self._consecutive_429[kind] = count
+        if count < self.QUOTA_429_THRESHOLD:
+            return
+        strikes = self._quota_strikes.get(kind, 0) + 1
+        cooldown = min(self.QUOTA_COOLDOWN * 2 ** (strikes - 1), self.QUOTA_MAX_COOLDOWN)
+        self._quota_strikes[kind] = strikes
+        self._quota_until[kind] = time.monotonic() + cooldown
+        self._consecutive_429[kind] = 0
+        logger.error("YandexGPT quota exceeded for %s calls, pausing them for %.0fs", kind, cooldown)
+    
+    def _record_quota_ok(self, kind: str):
+        """A successful call ends the 429 streak and the backoff escalation"""
+        self._consecutive_429[kind] = 0
+        self._quota_strikes[kind] = 0
+    
+    @classmethod
+    async def _get_client(cls) -> httpx.AsyncClient:
+        """Shared keep-alive HTTP client"""
+        if cls._client is None or cls._client.is_closed:
+            cls._client = httpx.AsyncClient(
+                http2=True,
+                timeout=httpx.Timeout(connect=10.0, read=30.0, write=10.0, pool=10.0),
+                limits=httpx.Limits(max_connections=100, max_keepalive_connections=20, keepalive_expiry=30)
+            )
+        return cls._client
+
+    @classmethod
+    def _get_limits(cls) -> Tuple[AdaptiveConcurrencyLimiter, AsyncTokenBucket]:
+        """Concurrency limiter and token bucket shared by all instances, bound to the running event loop"""
+        loop = asyncio.get_running_loop()
+        if cls._limits_loop is not loop:
+            cls._concurrency = AdaptiveConcurrencyLimiter(settings.yandex_max_concurrency)
+            cls._rate_limiter = AsyncTokenBucket(settings.yandex_rps)
+            cls._limits_loop = loop
+        return cls._concurrency, cls._rate_limiter
+
+    @classmethod
+    async def aclose(cls):
+        """Flush classification batchers and close the shared HTTP client (app shutdown)"""
+        batchers = list(cls._classify_batchers.values())
+        cls._classify_batchers.clear()
+        for batcher in batchers:
+            await batcher.aclose()
+        if cls._client is not None:
+            await cls._client.aclose()
+            cls._client = None
+
     def _has_credentials(self) -> bool:
         """Check if credentials are configured"""
         # Consider credentials set if non-empty
@@ -59,13 +362,26 @@ class YandexGPTService:
     def _safe_details(self, resp: httpx.Response) -> str:
         """Return trimmed response body for diagnostics"""
         try:
-            text = resp.text or ""
-            if len(text) > 1500:
-                text = text[:1500] + "...(truncated)"
+            # Decode only the prefix we show; error pages can be large
+            content = resp.content or b""
+            text = content[:1500].decode("utf-8", errors="replace")
+            if len(content) > 1500:
+                text += "...(truncated)"
             return text
         except Exception:
             return ""
 
+    def _error_message(self, resp: httpx.Response) -> str:
+        """Error message from a Yandex Cloud error body, or the trimmed body itself"""
+        try:
+            body = orjson.loads(resp.content)
+            error = body.get("error", body)
+            if isinstance(error, dict) and error.get("message"):
+                return str(error["message"])
+        except (orjson.JSONDecodeError, AttributeError):
+            pass
+        return self._safe_details(resp)
+
     def _auth_hint(self, resp: httpx.Response) -> str:
         """Provide hints for 401/403"""
         body = self._safe_details(resp)
@@ -85,11 +401,28 @@ class YandexGPTService:
             logger.warning(f"Model {model} not in available models. Using {self.model}")
             return False
         self.model = model
+        self._model_uri = f"gpt://{self.folder_id}/{self.model}/latest"
         logger.info(f"YandexGPT model changed to {model}")
         return True
     
+    def _health_key(self) -> tuple:
+        """Health cache key for the current credentials and model"""
+        return (self.api_key, self.folder_id, self.model)
+    
     async def check_api_health(self) -> Dict[str, Any]:
-        """Health check using completion endpoint."""
+        """Health check, reusing a recent successful probe"""
+        cached = self._health_cache.get(self._health_key())
+        if cached is not None:
+            return dict(cached)
+        
+        result = await self._probe_health()
+        # A 400 passed authentication but isn't proof the setup works: probe again next time
+        if result.get("available") and "warning" not in result:
+            self._health_cache[self._health_key()] = dict(result)
+        return result
+    
+    async def _probe_health(self) -> Dict[str, Any]:
+        """Health check using a 1-token completion (401/403 mean bad credentials)"""
         if not self.api_key:
             return {
                 "available": False,
@@ -107,31 +440,19 @@ class YandexGPTService:
                 "details": "Укажите Folder ID (b1...)"
             }
 
-        # Yandex requires /latest suffix on model URI
-        model_uri = f"gpt://{self.folder_id}/{self.model}/latest"
-        payload = {
-            "modelUri": model_uri,
-            "completionOptions": {
-                "stream": False,
-                "temperature": 0.0,
-                "maxTokens": 5
-            },
-            "messages": [{"role": "user", "text": "ping"}]
-        }
+        model_uri = self._model_uri
 
         try:
-            timeout = httpx.Timeout(connect=10.0, read=20.0, write=10.0, pool=10.0)
-            async with httpx.AsyncClient(timeout=timeout) as client:
-                response = await client.post(
-                    self.API_URL,
-                    headers={
-                        "Authorization": f"Api-Key {self.api_key}",
-                        "Content-Type": "application/json"
-                    },
-                    json=payload
-                )
+            client = await self._get_client()
+            response = await client.post(
+                self.API_URL,
+                headers=self._headers,
+                # Smallest possible completion: we only need to know the key is accepted
+                content=self._build_payload(".", 0.0, 1),
+                timeout=httpx.Timeout(connect=10.0, read=20.0, write=10.0, pool=10.0)
+            )
 
-            if response.status_code == 200:
+            if response.is_success:
                 return {
                     "available": True,
                     "credentials_set": True,
@@ -141,6 +462,31 @@ class YandexGPTService:
                     "status_code": response.status_code,
                 }
 
+            if response.status_code == 400:
+                message = self._error_message(response)
+                if self._BAD_SETUP_RE.search(message):
+                    # Wrong folder ID / model: the settings being checked are broken
+                    return {
+                        "available": False,
+                        "credentials_set": True,
+                        "model": self.model,
+                        "model_uri": model_uri,
+                        "quota_exceeded": False,
+                        "status_code": response.status_code,
+                        "error": f"Invalid folder ID or model (400): {message}",
+                        "details": "Ensure modelUri gpt://<folder>/<model> and that the key belongs to this folder.",
+                    }
+                # Request rejected after authentication passed: credentials are fine
+                return {
+                    "available": True,
+                    "credentials_set": True,
+                    "model": self.model,
+                    "model_uri": model_uri,
+                    "quota_exceeded": False,
+                    "status_code": response.status_code,
+                    "warning": f"Probe request rejected (400): {message}",
+                }
+
             if response.status_code == 429:
                 return {
                     "available": False,
@@ -197,7 +543,7 @@ class YandexGPTService:
                 "error": "Network connect error to Yandex LLM API.",
                 "details": str(e),
             }
-        except httpx.ReadTimeout as e:
+        except httpx.TimeoutException as e:
             return {
                 "available": False,
                 "credentials_set": True,
@@ -206,106 +552,328 @@ class YandexGPTService:
                 "error": "Timeout while calling Yandex LLM API.",
                 "details": str(e),
             }
-        except Exception as e:
+        except httpx.HTTPError as e:
             return {
                 "available": False,
                 "credentials_set": True,
                 "model": self.model,
                 "model_uri": model_uri,
-                "error": "Unexpected error while checking YandexGPT.",
+                "error": "HTTP error while checking YandexGPT.",
                 "details": str(e),
             }
     
-    async def _call_api(self, prompt: str, temperature: float = 0.7) -> Optional[str]:
-        """Make a call to YandexGPT chat API"""
+    async def _call_api(
+        self,
+        prompt: str,
+        temperature: float = 0.7,
+        max_tokens: int = 200,
+        kind: str = "draft"
+    ) -> Optional[str]:
+        """Make a call to YandexGPT chat API, joining an identical call already in flight"""
         if not self._has_credentials():
             logger.error("YandexGPT credentials not set")
             return None
+        if self._quota_active(kind):
+            return None
         
-        payload = {
-            "modelUri": f"gpt://{self.folder_id}/{self.model}/latest",
-            "completionOptions": {
-                "stream": False,
-                "temperature": temperature,
-                "maxTokens": 200
-            },
-            "messages": [{"role": "user", "text": prompt}]
-        }
+        # The API key is part of the key: callers never share a result across credentials
+        key = hashlib.blake2b(
+            f"{self.api_key}|{self._model_uri}|{temperature}|{max_tokens}|{prompt}".encode(), digest_size=16
+        ).digest()
+        # No await between lookup and insert, so the check-and-set is atomic on the event loop
+        future = self._inflight.get(key)
+        if future is not None:
+            return await asyncio.shield(future)
+        
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
         try:
-            async with httpx.AsyncClient(timeout=30) as client:
-                response = await client.post(
-                    self.API_URL,
-                    headers={
-                        "Authorization": f"Api-Key {self.api_key}",
-                        "Content-Type": "application/json"
-                    },
-                    json=payload
-                )
+            result = await self._request_completion(prompt, temperature, max_tokens, kind)
+            if result is None:
+                # Failed call: make the next health check probe the API again
+                self._health_cache.pop(self._health_key(), None)
+            future.set_result(result)
+            return result
+        finally:
+            self._inflight.pop(key, None)
+            if not future.done():
+                # Owner was cancelled: waiters treat it as a failed call
+                future.set_result(None)
+    
+    async def _request_completion(self, prompt: str, temperature: float, max_tokens: int, kind: str) -> Optional[str]:
+        """Send one completion request (with retries) to YandexGPT"""
+        content = self._build_payload(prompt, temperature, max_tokens)
+        try:
+            client = await self._get_client()
+            concurrency, rate_limiter = self._get_limits()
+            for attempt in range(self.MAX_RETRIES + 1):
+                async with concurrency:
+                    await rate_limiter.acquire()
+                    response = await client.post(
+                        self.API_URL,
+                        headers=self._headers,
+                        content=content
+                    )
+                    if response.status_code in (429, 503):
+                        concurrency.record_overload()
+                    elif response.status_code == 200:
+                        concurrency.record_success()
+                
+                if response.status_code == 429:
+                    self._record_rate_limited(kind)
                 
                 if response.status_code == 200:
-                    data = response.json()
+                    self._record_quota_ok(kind)
+                    data = orjson.loads(response.content)
                     result = data.get("result", {})
                     choices = result.get("alternatives", [])
                     if choices:
                         return choices[0].get("message", {}).get("text", "").strip()
-                elif response.status_code == 429:
-                    self.quota_exceeded = True
-                    logger.error("YandexGPT quota exceeded")
                     return None
+                
+                # Rate limit and server errors are transient: back off and retry
+                retryable = response.status_code == 429 or response.status_code >= 500
+                if retryable and attempt < self.MAX_RETRIES and not self._quota_active(kind):
+                    delay = self._retry_delay(response, attempt)
+                    logger.warning(
+                        "YandexGPT HTTP %s, retry %d/%d in %.1fs",
+                        response.status_code, attempt + 1, self.MAX_RETRIES, delay
+                    )
+                    await asyncio.sleep(delay)
+                    continue
+                
+                if response.status_code == 429:
+                    logger.warning("YandexGPT rate limited, giving up after %d attempts", attempt + 1)
                 else:
-                    logger.warning(f"YandexGPT API error: {response.status_code} - {response.text}")
-                    return None
-        except asyncio.TimeoutError:
-            logger.error("YandexGPT API timeout")
+                    logger.warning(
+                        "YandexGPT API error: %s - %s",
+                        response.status_code, response.content[:2048].decode("utf-8", errors="replace")
+                    )
+                return None
+        except httpx.TimeoutException:
+            logger.warning("YandexGPT API timeout")
+            return None
+        except httpx.HTTPError as e:
+            logger.warning("YandexGPT API call failed: %s", e)
             return None
-        except Exception as e:
-            logger.error(f"YandexGPT API call failed: {e}")
+        except orjson.JSONDecodeError as e:
+            logger.warning("YandexGPT returned invalid JSON: %s", e)
             return None
     
-    async def analyze_sentiment(self, review_text: str) -> str:
-        """Analyze sentiment of a review"""
-        if self.quota_exceeded or not self._has_credentials():
-            return "neutral"
+    async def _call_api_stream(
+        self,
+        prompt: str,
+        temperature: float = 0.7,
+        max_tokens: int = 200
+    ) -> AsyncIterator[str]:
+        """Stream a completion, yielding text deltas as they arrive (no retries)"""
+        if not self._has_credentials():
+            logger.error("YandexGPT credentials not set")
+            return
+        if self._quota_active("draft"):
+            return
+        
+        content = self._build_payload(prompt, temperature, max_tokens, stream=True)
+        try:
+            client = await self._get_client()
+            concurrency, rate_limiter = self._get_limits()
+            # The slot is held for the whole stream
+            async with concurrency:
+                await rate_limiter.acquire()
+                async with client.stream("POST", self.API_URL, headers=self._headers, content=content) as response:
+                    if response.status_code != 200:
+                        body = await response.aread()
+                        if response.status_code == 429:
+                            self._record_rate_limited("draft")
+                        if response.status_code in (429, 503):
+                            concurrency.record_overload()
+                        logger.warning(
+                            "YandexGPT stream error: %s - %s",
+                            response.status_code, body[:2048].decode("utf-8", errors="replace")
+                        )
+                        return
+                    
+                    self._record_quota_ok("draft")
+                    concurrency.record_success()
+                    # Each line is a JSON chunk carrying the full text generated so far
+                    sent = 0
+                    async for line in response.aiter_lines():
+                        if not line.strip():
+                            continue
+                        alternatives = orjson.loads(line).get("result", {}).get("alternatives", [])
+                        if not alternatives:
+                            continue
+                        text = alternatives[0].get("message", {}).get("text", "")
+                        if len(text) > sent:
+                            yield text[sent:]
+                            sent = len(text)
+        except httpx.TimeoutException:
+            logger.warning("YandexGPT stream timeout")
+        except httpx.HTTPError as e:
+            logger.warning("YandexGPT stream failed: %s", e)
+        except orjson.JSONDecodeError as e:
+            logger.warning("YandexGPT stream returned invalid JSON: %s", e)
+    
+    def _build_payload(self, prompt: str, temperature: float, max_tokens: int, stream: bool = False) -> bytes:
+        """orjson-encoded completion request body"""
+        return orjson.dumps({
+            "modelUri": self._model_uri,
+            "completionOptions": _completion_options(temperature, max_tokens, stream),
+            "messages": [{"role": "user", "text": prompt}]
+        })
+    
+    def _retry_delay(self, response: httpx.Response, attempt: int) -> float:
+        """Seconds to wait before retry: exponential backoff with jitter, at least Retry-After"""
+        # Only our own backoff is capped; the server's Retry-After is honoured in full
+        delay = min(self.RETRY_BASE_DELAY * (2 ** attempt) + random.uniform(0, self.RETRY_JITTER), self.RETRY_MAX_DELAY)
+        retry_after = response.headers.get("Retry-After")
+        if retry_after:
+            try:
+                delay = max(float(retry_after), delay)
+            except ValueError:
+                pass
+        return delay
+    
+    def _cache_key(self, review_text: str) -> bytes:
+        """Cache key for per-review results of the current model"""
+        normalized = self._normalize_review_text(review_text)
+        return hashlib.blake2b(f"{self.model}|{normalized}".encode(), digest_size=16).digest()
+    
+    @classmethod
+    def _normalize_review_text(cls, review_text: str) -> str:
+        """Case, spacing and repeated punctuation don't change the labels ("Спасибо!!" == "спасибо!")"""
+        text = cls._WHITESPACE_RE.sub(" ", review_text.casefold()).strip()
+        return cls._REPEATED_PUNCT_RE.sub(r"\1", text)
+    
+    async def classify(self, review_text: str) -> Tuple[str, str]:
+        """Sentiment and category of a review (concurrent callers share batched API calls)"""
+        if LocalClassifier.get() is None and not self._classify_api_available():
+            return "neutral", "other"
+        
+        cached = self._classify_cache.get(self._cache_key(review_text))
+        if cached is not None:
+            return cached
         
-        prompt = self.SENTIMENT_PROMPT.format(review_text=review_text)
-        result = await self._call_api(prompt, temperature=0.1)
+        return await self._get_classify_batcher().process(review_text)
+    
+    def _get_classify_batcher(self) -> AsyncBatcher:
+        """Batcher for this instance's credentials and model"""
+        key = (self.api_key, self._model_uri)
+        batcher = self._classify_batchers.get(key)
+        if batcher is None:
+            batcher = AsyncBatcher(self.classify_batch, max_batch_size=16, max_queue_time=0.05, concurrency=4)
+            self._classify_batchers[key] = batcher
+        return batcher
+    
+    def _parse_classification(self, result: str) -> Tuple[str, str]:
+        """Parse 'SENTIMENT=...;CATEGORY=...', falling back to keyword search over the whole answer"""
+        match = self._CLASSIFY_RE.search(result)
+        if match:
+            return self._parse_sentiment(match.group(1)), self._parse_category(match.group(2))
+        return self._parse_sentiment(result), self._parse_category(result)
+    
+    async def classify_batch(self, texts: List[str], k: Optional[int] = None) -> List[Tuple[str, str]]:
+        """
+        (sentiment, category) for many reviews, k reviews per API call
         
-        if result:
-            sentiment = result.lower()
-            for word in ["положительная", "positive", "хорошо", "good"]:
-                if word in sentiment:
-                    return "positive"
-            for word in ["отрицательная", "negative", "плохо", "bad"]:
-                if word in sentiment:
-                    return "negative"
+        Cached texts are not sent; the local classifier (if configured) answers the
+        reviews it is confident about; the rest go to the API in concurrent chunks.
+        A review missing from the answer gets ("neutral", "other") and is not cached.
+        """
+        k = max(1, k or self.CLASSIFY_BATCH_SIZE)
+        results: List[Tuple[str, str]] = [("neutral", "other")] * len(texts)
+        local = LocalClassifier.get()
+        if local is None and not self._classify_api_available():
+            return results
         
+        # Cache hits are answered directly; duplicate texts are sent once
+        pending: Dict[bytes, List[int]] = {}
+        pending_texts: Dict[bytes, str] = {}
+        for i, text in enumerate(texts):
+            key = self._cache_key(text)
+            cached = self._classify_cache.get(key)
+            if cached is not None:
+                results[i] = cached
+            else:
+                pending.setdefault(key, []).append(i)
+                pending_texts.setdefault(key, text)
+        
+        if pending and local is not None:
+            # CPU-bound inference runs off the event loop
+            keys = list(pending)
+            labels = await asyncio.to_thread(local.predict_batch, [pending_texts[key] for key in keys])
+            self._store_labels(keys, labels, pending, results)
+        if not pending or not self._classify_api_available():
+            return results
+        
+        keys = list(pending)
+        chunks = [keys[i:i + k] for i in range(0, len(keys), k)]
+        answers = await asyncio.gather(*(
+            self._classify_chunk([pending_texts[key] for key in chunk]) for chunk in chunks
+        ))
+        for chunk, labels in zip(chunks, answers):
+            self._store_labels(chunk, labels, pending, results)
+        return results
+    
+    def _store_labels(
+        self,
+        keys: List[bytes],
+        labels: List[Optional[Tuple[str, str]]],
+        pending: Dict[bytes, List[int]],
+        results: List[Tuple[str, str]]
+    ):
+        """Cache answered labels and fill their positions; answered keys leave `pending`"""
+        for key, label in zip(keys, labels):
+            if label is None:
+                continue
+            self._classify_cache[key] = label
+            for i in pending.pop(key):
+                results[i] = label
+    
+    def _classify_api_available(self) -> bool:
+        """Whether classification may be sent to YandexGPT now"""
+        return self._has_credentials() and not self._quota_active("classify")
+    
+    async def _classify_chunk(self, texts: List[str]) -> List[Optional[Tuple[str, str]]]:
+        """One numbered-prompt call; None for reviews the answer doesn't cover"""
+        reviews = "\n".join(
+            f"{n}: {self._WHITESPACE_RE.sub(' ', text).strip()}" for n, text in enumerate(texts, 1)
+        )
+        prompt = self.COMBINED_CLASSIFY_BATCH_PROMPT.format(reviews=reviews)
+        result = await self._call_api(prompt, temperature=0.0, max_tokens=30 * len(texts), kind="classify")
+        labels: List[Optional[Tuple[str, str]]] = [None] * len(texts)
+        if not result:
+            return labels
+        for match in self._CLASSIFY_LINE_RE.finditer(result):
+            n = int(match.group(1))
+            if 1 <= n <= len(texts):
+                labels[n - 1] = (self._parse_sentiment(match.group(2)), self._parse_category(match.group(3)))
+        if len(texts) == 1 and labels[0] is None:
+            # Single review answered without the number: parse the answer as a whole
+            labels[0] = self._parse_classification(result)
+        return labels
+    
+    async def analyze_sentiment(self, review_text: str) -> str:
+        """Analyze sentiment of a review"""
+        sentiment, _ = await self.classify(review_text)
+        return sentiment
+    
+    def _parse_sentiment(self, result: str) -> str:
+        """Map model answer to positive/negative/neutral"""
+        for pattern, sentiment in self._SENTIMENT_PATTERNS:
+            if pattern.search(result):
+                return sentiment
         return "neutral"
     
     async def categorize_review(self, review_text: str) -> str:
         """Categorize the main topic of a review"""
-        if self.quota_exceeded or not self._has_credentials():
-            return "other"
-        
-        prompt = self.CATEGORY_PROMPT.format(review_text=review_text)
-        result = await self._call_api(prompt, temperature=0.1)
-        
-        if result:
-            category = result.lower()
-            categories = {
-                "качество": "quality",
-                "quality": "quality",
-                "доставка": "delivery",
-                "delivery": "delivery",
-                "упаковка": "packaging",
-                "packaging": "packaging",
-                "сервис": "service",
-                "service": "service"
-            }
-            for key, val in categories.items():
-                if key in category:
-                    return val
-        
-        return "other"
+        _, category = await self.classify(review_text)
+        return category
+    
+    def _parse_category(self, result: str) -> str:
+        """Map model answer to quality/delivery/packaging/service/other"""
+        match = self._CATEGORY_RE.search(result)
+        return match.lastgroup if match else "other"
     
     async def generate_response_drafts(
         self,
@@ -316,36 +884,253 @@ class YandexGPTService:
         custom_prompt: Optional[str] = None
     ) -> List[str]:
         """Generate response draft variants"""
-        if self.quota_exceeded or not self._has_credentials():
+        if self._quota_active("draft") or not self._has_credentials():
             logger.warning("YandexGPT not available for draft generation")
             return []
         
+        signature = signature or settings.response_signature
+        drafts = await self._generate_drafts(review_text, num_variants, tone, signature, custom_prompt)
+        
+        # If API fails, add a fallback response
+        fallback = f"Спасибо за ваш отзыв! {signature}"
+        drafts.extend([fallback] * (num_variants - len(drafts)))
+        return drafts
+    
+    async def _generate_drafts(
+        self,
+        review_text: str,
+        num_variants: int = 3,
+        tone: Optional[str] = None,
+        signature: Optional[str] = None,
+        custom_prompt: Optional[str] = None
+    ) -> List[str]:
+        """Distinct drafts the API produced (at most num_variants, no fallback padding)"""
         tone = tone or settings.response_tone
         signature = signature or settings.response_signature
         
-        drafts = []
-        for variant in range(1, num_variants + 1):
-            if custom_prompt:
-                # Use custom prompt if provided
-                prompt = custom_prompt.format(
-                    review_text=review_text,
-                    tone=tone,
-                    signature=signature,
-                    variant=variant
-                )
-            else:
-                prompt = self.RESPONSE_PROMPT.format(
+        if not custom_prompt and num_variants > 1:
+            drafts = await self._generate_drafts_single_call(review_text, num_variants, tone, signature)
+            # A failed call ([]) is not retried as num_variants more requests
+            if drafts is not None:
+                return drafts
+        
+        if custom_prompt:
+            prompts = [
+                custom_prompt.format(
                     review_text=review_text,
                     tone=tone,
                     signature=signature,
                     variant=variant
                 )
+                for variant in range(1, num_variants + 1)
+            ]
+        else:
+            # Only the variant number differs, so format the shared head once
+            head = self.RESPONSE_PROMPT_HEAD.format(review_text=review_text, tone=tone, signature=signature)
+            prompts = [f"{head}{variant}:" for variant in range(1, num_variants + 1)]
+        
+        # All variants are independent requests: run them concurrently, keep order
+        results = await asyncio.gather(
+            *(self._call_api(prompt, temperature=0.7) for prompt in prompts),
+            return_exceptions=True
+        )
+        
+        drafts = self._unique([r for r in results if r and not isinstance(r, Exception)])
+        
+        # Fewer distinct variants than asked (duplicates or failed calls): one more, more random attempt
+        if drafts and len(drafts) < num_variants and not self._quota_active("draft"):
+            extra = await self._call_api(prompts[-1], temperature=self.DRAFT_FILL_TEMPERATURE)
+            if extra and extra not in drafts:
+                drafts.append(extra)
+        return drafts
+    
+    @staticmethod
+    def _unique(drafts: List[str]) -> List[str]:
+        """Drop repeated drafts, keeping order"""
+        seen = set()
+        return [d for d in drafts if not (d in seen or seen.add(d))]
+    
+    async def generate_response_drafts_batch(
+        self,
+        reviews: List[Dict[str, Any]],
+        output_jsonl: str,
+        max_concurrency: int = 8,
+        fsync_every: int = 20
+    ) -> int:
+        """
+        Generate drafts for many reviews, checkpointing each result to a JSONL file
+        
+        Each finished review is appended as {"id": ..., "drafts": [...]}. Reviews whose id
+        is already in the file are skipped, so re-running after a crash resumes the batch.
+        Only drafts the API produced are written: reviews with none (API unavailable or
+        every call failed) are left out and will be retried. File I/O runs in threads.
+        
+        Returns:
+            Number of reviews written in this run
+        """
+        if self._quota_active("draft") or not self._has_credentials():
+            logger.warning("YandexGPT not available for draft generation")
+            return 0
+        
+        done_ids = await asyncio.to_thread(self._read_checkpoint, output_jsonl)
+        pending = [r for r in reviews if str(self._review_id(r)) not in done_ids]
+        if len(pending) < len(reviews):
+            logger.info(f"Draft batch: {len(reviews) - len(pending)} reviews already in {output_jsonl}, skipping")
+        
+        sem = asyncio.Semaphore(max(1, max_concurrency))
+        written = 0
+        
+        out = await asyncio.to_thread(self._open_checkpoint, output_jsonl)
+        try:
+            async def one(review: Dict[str, Any]):
+                nonlocal written
+                review_text = review.get("text") or review.get("comment") or review.get("content") or ""
+                async with sem:
+                    drafts = await self._generate_drafts(review_text)
+                if not drafts:
+                    return
+                line = orjson.dumps({"id": self._review_id(review), "drafts": drafts}) + b"\n"
+                await asyncio.to_thread(self._append_checkpoint, out, line, (written + 1) % fsync_every == 0)
+                written += 1
             
-            result = await self._call_api(prompt, temperature=0.7)
-            if result:
-                drafts.append(result)
-            else:
-                # If API fails, add a fallback response
-                drafts.append(f"Спасибо за ваш отзыв! {signature}")
+            # Every review finishes before the file is closed; a failed one is retried on the next run
+            results = await asyncio.gather(*(one(r) for r in pending), return_exceptions=True)
+            for review, result in zip(pending, results):
+                if isinstance(result, Exception):
+                    logger.warning("Draft batch: review %s failed: %s", self._review_id(review), result)
+        finally:
+            await asyncio.to_thread(self._close_checkpoint, out)
         
+        return written
+    
+    @staticmethod
+    def _open_checkpoint(path: str):
+        """Open a draft batch file for appending"""
+        out = open(path, "ab+")
+        if out.seek(0, os.SEEK_END):
+            out.seek(-1, os.SEEK_END)
+            if out.read(1) != b"\n":
+                # Terminate a line cut short by a crash before appending
+                out.write(b"\n")
+        return out
+    
+    @staticmethod
+    def _append_checkpoint(out, line: bytes, sync: bool):
+        """Append one record; fsync when asked"""
+        out.write(line)
+        out.flush()
+        if sync:
+            os.fsync(out.fileno())
+    
+    @staticmethod
+    def _close_checkpoint(out):
+        """Flush a draft batch file to disk and close it"""
+        try:
+            out.flush()
+            os.fsync(out.fileno())
+        finally:
+            out.close()
+    
+    @staticmethod
+    def _review_id(review: Dict[str, Any]) -> Any:
+        """Review id from Ozon API data or a DB row dict"""
+        return review.get("id") or review.get("ozon_review_id")
+    
+    @staticmethod
+    def _read_checkpoint(path: str) -> set:
+        """Ids already written to a draft batch file"""
+        done = set()
+        if not os.path.exists(path):
+            return done
+        with open(path, "rb") as f:
+            for line in f:
+                try:
+                    done.add(str(orjson.loads(line)["id"]))
+                except (orjson.JSONDecodeError, KeyError, TypeError):
+                    # Line cut short by a crash: that review is generated again
+                    continue
+        return done
+    
+    async def generate_response_drafts_stream(
+        self,
+        review_text: str,
+        num_variants: int = 3,
+        tone: Optional[str] = None,
+        signature: Optional[str] = None
+    ) -> AsyncIterator[Tuple[int, str]]:
+        """
+        Stream draft variants concurrently as (variant_number, text_delta) pairs
+        
+        Chunks of different variants are interleaved in arrival order.
+        A variant that produced no text gets the fallback response at the end.
+        """
+        if self._quota_active("draft") or not self._has_credentials():
+            logger.warning("YandexGPT not available for draft generation")
+            return
+        
+        tone = tone or settings.response_tone
+        signature = signature or settings.response_signature
+        head = self.RESPONSE_PROMPT_HEAD.format(review_text=review_text, tone=tone, signature=signature)
+        
+        queue: asyncio.Queue = asyncio.Queue()
+        
+        async def pump(variant: int):
+            try:
+                async for delta in self._call_api_stream(f"{head}{variant}:", temperature=0.7):
+                    await queue.put((variant, delta))
+            finally:
+                await queue.put((variant, None))
+        
+        tasks = [asyncio.create_task(pump(variant)) for variant in range(1, num_variants + 1)]
+        produced = set()
+        try:
+            remaining = len(tasks)
+            while remaining:
+                variant, delta = await queue.get()
+                if delta is None:
+                    remaining -= 1
+                    continue
+                produced.add(variant)
+                yield variant, delta
+        finally:
+            # Client went away or consumer stopped early: stop the upstream streams
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+        
+        fallback = f"Спасибо за ваш отзыв! {signature}"
+        for variant in range(1, num_variants + 1):
+            if variant not in produced:
+                yield variant, fallback
+    
+    async def _generate_drafts_single_call(
+        self,
+        review_text: str,
+        num_variants: int,
+        tone: str,
+        signature: str
+    ) -> Optional[List[str]]:
+        """
+        All variants from one completion
+        
+        [] if the call failed; None if the answer doesn't split into num_variants drafts.
+        """
+        prompt = self.MULTI_RESPONSE_PROMPT.format(
+            num_variants=num_variants,
+            review_text=review_text,
+            tone=tone,
+            signature=signature
+        )
+        result = await self._call_api(prompt, temperature=0.7, max_tokens=self.MAX_TOKENS_PER_DRAFT * num_variants)
+        if not result:
+            return []
+        
+        drafts = [
+            self._DRAFT_LABEL_RE.sub("", part).strip()
+            for part in result.split(self.DRAFTS_DELIMITER)
+        ]
+        drafts = self._unique([d for d in drafts if d])
+        if len(drafts) != num_variants:
+            logger.info(f"YandexGPT returned {len(drafts)} drafts instead of {num_variants}, requesting separately")
+            return None
         return drafts
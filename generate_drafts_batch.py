@@ -0,0 +1,39 @@
+#!/usr/bin/env python3
+"""Generate YandexGPT drafts for unanswered reviews into a JSONL file
+
+Usage: python generate_drafts_batch.py [drafts.jsonl]
+Re-running with the same file skips reviews already in it (resume after a crash).
+"""
+import asyncio
+import logging
+import sys
+from app.database import SessionLocal
+from app.models.review import Review
+from app.services.yandex_service import YandexGPTService
+
+
+def load_unanswered_reviews():
+    """Unanswered reviews as {"ozon_review_id", "text"} dicts"""
+    db = SessionLocal()
+    try:
+        rows = db.query(Review.ozon_review_id, Review.text).filter(Review.answered == False).all()
+        return [{"ozon_review_id": row.ozon_review_id, "text": row.text or ""} for row in rows]
+    finally:
+        db.close()
+
+
+async def generate_drafts(output_jsonl: str) -> int:
+    """Run the checkpointed batch and close the shared HTTP client"""
+    reviews = load_unanswered_reviews()
+    print(f"📝 Unanswered reviews: {len(reviews)}")
+    try:
+        return await YandexGPTService().generate_response_drafts_batch(reviews, output_jsonl)
+    finally:
+        await YandexGPTService.aclose()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    output = sys.argv[1] if len(sys.argv) > 1 else "drafts.jsonl"
+    written = asyncio.run(generate_drafts(output))
+    print(f"✅ Drafts written for {written} reviews to {output}")
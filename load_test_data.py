@@ -1,6 +1,7 @@
 #!/usr/bin/env python3
 """Load test data into the database"""
 from datetime import datetime, timedelta
+from sqlalchemy import func
 from app.database import SessionLocal
 from app.models.review import Review
 
@@ -64,21 +65,19 @@ def load_test_data():
     try:
         # Clear existing test data
         db.query(Review).filter(Review.ozon_review_id.like("test-%")).delete()
-        db.commit()
         
-        # Add test reviews
-        for review_data in test_reviews:
-            review = Review(**review_data)
-            db.add(review)
+        # Add test reviews (one executemany INSERT, same transaction as the delete)
+        db.bulk_insert_mappings(Review, test_reviews)
         
         db.commit()
         print(f"✅ Loaded {len(test_reviews)} test reviews")
         
         # Show stats
-        total = db.query(Review).count()
-        positive = db.query(Review).filter_by(sentiment="positive").count()
-        neutral = db.query(Review).filter_by(sentiment="neutral").count()
-        negative = db.query(Review).filter_by(sentiment="negative").count()
+        counts = dict(db.query(Review.sentiment, func.count()).group_by(Review.sentiment).all())
+        total = sum(counts.values())
+        positive = counts.get("positive", 0)
+        neutral = counts.get("neutral", 0)
+        negative = counts.get("negative", 0)
         
         print(f"📊 Total reviews: {total}")
         print(f"   👍 Positive: {positive}")
@@ -1,11 +1,14 @@
 """Main FastAPI application"""
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import ORJSONResponse
 from fastapi.staticfiles import StaticFiles
 import logging
 import os
 from app.database import Base, engine
 from app.background_tasks import start_background_tasks, shutdown_background_tasks
+from app.services.ai_service import AIService
+from app.services.yandex_service import YandexGPTService
 from app.api.routes import reviews, responses, settings, integrations
 
 # Configure logging
@@ -19,7 +22,8 @@ Base.metadata.create_all(bind=engine)
 app = FastAPI(
     title="Ozon Review Service",
     description="Service for managing Ozon marketplace reviews and responses",
-    version="1.0.0"
+    version="1.0.0",
+    default_response_class=ORJSONResponse
 )
 
 # Add CORS middleware
@@ -56,8 +60,10 @@ async def startup_event():
 
 @app.on_event("shutdown")
 async def shutdown_event():
-    """Clean up background schedulers."""
+    """Clean up background schedulers and shared HTTP clients."""
     await shutdown_background_tasks()
+    await YandexGPTService.aclose()
+    await AIService.aclose()
 
 
 if __name__ == "__main__":
@@ -29,13 +29,16 @@ def main():
         logger.info("Make sure you have ngrok installed or download from https://ngrok.com")
         sys.exit(1)
     
-    # Start FastAPI server
+    # Start FastAPI server (uvloop is POSIX-only, keep stock asyncio on Windows)
     logger.info("Starting FastAPI server...")
     uvicorn.run(
         "main:app",
         host="0.0.0.0",
         port=port,
-        reload=False
+        reload=False,
+        loop="uvloop" if sys.platform != "win32" else "asyncio",
+        http="httptools",
+        workers=int(os.getenv("WEB_CONCURRENCY", "1"))
     )
 
 if __name__ == "__main__":
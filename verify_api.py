@@ -1,12 +1,12 @@
 #!/usr/bin/env python
 """API VERIFICATION SCRIPT - Проверка всех endpoints"""
 
-import requests
+import asyncio
+import httpx
 import json
 import sys
 from typing import Tuple
-import time
-from openai import OpenAI, AuthenticationError, RateLimitError, APIError
+from openai import AsyncOpenAI, AuthenticationError, RateLimitError, APIError
 
 # Color codes for terminal output
 GREEN = '\033[92m'
@@ -46,15 +46,13 @@ def check_test(test_name: str, result: bool, message: str = ""):
                 print(f"   └─ Error: {message}")
             tests_failed += 1
 
-def test_endpoint(method: str, endpoint: str, name: str, data=None) -> Tuple[bool, str]:
+async def test_endpoint(client: httpx.AsyncClient, method: str, endpoint: str, name: str, data=None) -> Tuple[bool, str]:
     """Test an API endpoint"""
     try:
-        url = f"{API_BASE}{endpoint}"
-        
         if method.upper() == "GET":
-            response = requests.get(url, timeout=5)
+            response = await client.get(endpoint)
         elif method.upper() == "POST":
-            response = requests.post(url, json=data, timeout=5)
+            response = await client.post(endpoint, json=data)
         else:
             return False, f"Unknown method: {method}"
         
@@ -63,39 +61,73 @@ def test_endpoint(method: str, endpoint: str, name: str, data=None) -> Tuple[boo
         else:
             return False, f"HTTP {response.status_code}: {response.text[:100]}"
     
-    except requests.exceptions.ConnectionError:
+    except httpx.ConnectError:
         return False, "Connection refused - is server running?"
     except Exception as e:
         return False, str(e)
 
 def main():
+    return asyncio.run(run_checks())
+
+async def run_checks():
     print(f"\n{CYAN}{BOLD}🔍 OZON REVIEW SERVICE - ПРОВЕРКА API{RESET}")
     print("=" * 50)
     
-    # 1. Check server connectivity
-    print_header("1️⃣  ПРОВЕРКА ПОДКЛЮЧЕНИЯ К СЕРВЕРУ")
-    
-    try:
-        response = requests.get(f"{API_BASE}/api/health/status", timeout=5)
-        if response.status_code == 200:
-            check_test("Server is responding", True)
-        else:
-            check_test("Server is responding", False, f"HTTP {response.status_code}")
-    except Exception as e:
-        print(f"{RED}❌ CRITICAL: Cannot connect to server on {API_BASE}{RESET}")
-        print(f"   Please start the server: python main.py")
-        sys.exit(1)
-    
-    # Wait a moment for server to fully initialize
-    time.sleep(1)
+    # One pooled client for every check; the transport retries failed connects
+    transport = httpx.AsyncHTTPTransport(
+        retries=2,
+        limits=httpx.Limits(max_connections=20, max_keepalive_connections=20)
+    )
+    async with httpx.AsyncClient(
+        base_url=API_BASE,
+        timeout=5,
+        transport=transport
+    ) as client:
+        # 1. Check server connectivity
+        print_header("1️⃣  ПРОВЕРКА ПОДКЛЮЧЕНИЯ К СЕРВЕРУ")
+        
+        try:
+            response = await client.get("/api/health/status")
+            if response.status_code == 200:
+                check_test("Server is responding", True)
+            else:
+                check_test("Server is responding", False, f"HTTP {response.status_code}")
+        except Exception as e:
+            print(f"{RED}❌ CRITICAL: Cannot connect to server on {API_BASE}{RESET}")
+            print(f"   Please start the server: python main.py")
+            sys.exit(1)
+        
+        # Wait a moment for server to fully initialize
+        await asyncio.sleep(1)
+        
+        # Independent checks run concurrently; results are printed below in a fixed order
+        (
+            health_status, integrations, reviews, reviews_paged,
+            recent_responses, app_settings, ozon_test, openai_test
+        ) = await asyncio.gather(
+            test_endpoint(client, "GET", "/api/health/status", "GET /api/health/status"),
+            test_endpoint(client, "GET", "/api/health/integrations", "GET /api/health/integrations"),
+            test_endpoint(client, "GET", "/api/reviews", "GET /api/reviews"),
+            test_endpoint(client, "GET", "/api/reviews?limit=5", "GET /api/reviews?limit=5"),
+            test_endpoint(client, "GET", "/api/responses/history/recent", "GET /api/responses/history/recent"),
+            test_endpoint(client, "GET", "/api/settings", "GET /api/settings"),
+            # Integration test endpoints with dummy credentials
+            test_endpoint(client, "POST", "/api/health/test-ozon", "POST /api/health/test-ozon", {
+                "client_id": "test",
+                "api_key": "test"
+            }),
+            test_endpoint(client, "POST", "/api/health/test-openai", "POST /api/health/test-openai", {
+                "api_key": "test"
+            }),
+        )
     
     # 2. Test Health endpoints
     print_header("2️⃣  ПРОВЕРКА HEALTH ENDPOINTS")
     
-    success, response = test_endpoint("GET", "/api/health/status", "GET /api/health/status")
+    success, response = health_status
     check_test("GET /api/health/status", success, response if not success else "")
     
-    success, response = test_endpoint("GET", "/api/health/integrations", "GET /api/health/integrations")
+    success, response = integrations
     check_test("GET /api/health/integrations", success, response if not success else "")
     
     # Parse and display integrations status
@@ -123,22 +155,22 @@ def main():
     # 3. Test Review endpoints
     print_header("3️⃣  ПРОВЕРКА REVIEW ENDPOINTS")
     
-    success, response = test_endpoint("GET", "/api/reviews", "GET /api/reviews")
+    success, response = reviews
     check_test("GET /api/reviews", success, response if not success else "")
     
-    success, response = test_endpoint("GET", "/api/reviews?limit=5", "GET /api/reviews?limit=5")
+    success, response = reviews_paged
     check_test("GET /api/reviews (with pagination)", success, response if not success else "")
     
     # 4. Test Response endpoints
     print_header("4️⃣  ПРОВЕРКА RESPONSE ENDPOINTS")
     
-    success, response = test_endpoint("GET", "/api/responses/history/recent", "GET /api/responses/history/recent")
+    success, response = recent_responses
     check_test("GET /api/responses/history/recent", success, response if not success else "")
     
     # 5. Test Settings endpoints
     print_header("5️⃣  ПРОВЕРКА SETTINGS ENDPOINTS")
     
-    success, response = test_endpoint("GET", "/api/settings", "GET /api/settings")
+    success, response = app_settings
     check_test("GET /api/settings", success, response if not success else "")
     
     # 6. Test Integration test endpoints
@@ -146,17 +178,12 @@ def main():
     
     # Test Ozon connection with dummy credentials
     print("Testing Ozon API endpoint...")
-    success, response = test_endpoint("POST", "/api/health/test-ozon", "POST /api/health/test-ozon", {
-        "client_id": "test",
-        "api_key": "test"
-    })
+    success, response = ozon_test
     check_test("POST /api/health/test-ozon (accepts requests)", success, response if not success else "")
     
     # Test OpenAI connection with dummy credentials
     print("Testing OpenAI API endpoint...")
-    success, response = test_endpoint("POST", "/api/health/test-openai", "POST /api/health/test-openai", {
-        "api_key": "test"
-    })
+    success, response = openai_test
     check_test("POST /api/health/test-openai (accepts requests)", success, response if not success else "")
     
     # 7. Summary
@@ -181,7 +208,7 @@ def main():
         print("Пожалуйста, проверьте ошибки выше перед использованием.")
         return 1
 
-def check_openai_key(api_key: str):
+async def check_openai_key(api_key: str):
     """Detaily check OpenAI API key and diagnose issues"""
     print(f"\n{CYAN}{BOLD}🔍 ДЕТАЛЬНАЯ ДИАГНОСТИКА OPENAI КЛЮЧА{RESET}")
     print("=" * 50)
@@ -199,11 +226,11 @@ def check_openai_key(api_key: str):
         print(f"{GREEN}✅ Формат ключа верный (sk-proj-){RESET}")
     
     # Try to connect
-    client = OpenAI(api_key=api_key)
+    client = AsyncOpenAI(api_key=api_key, timeout=10.0, max_retries=0)
     
     try:
         print("\n📡 Попытка подключения к OpenAI API...")
-        response = client.chat.completions.create(
+        response = await client.chat.completions.create(
             model='gpt-3.5-turbo',
             messages=[{'role': 'user', 'content': 'test'}],
             max_tokens=5
@@ -262,13 +289,16 @@ def check_openai_key(api_key: str):
         print(f"   Тип: {type(e).__name__}")
         print(f"   Деталь: {str(e)}")
         return False
+    
+    finally:
+        await client.close()
 
 
 if __name__ == "__main__":
     # Если передан аргумент - проверить конкретный ключ
     if len(sys.argv) > 1:
         api_key = sys.argv[1]
-        success = check_openai_key(api_key)
+        success = asyncio.run(check_openai_key(api_key))
         sys.exit(0 if success else 1)
     else:
         # Иначе запустить полную проверку